@@ -0,0 +1,86 @@
+import asyncio
+from models import SQLStorage
+
+
+class AsyncSQLStorage():
+    ''' asyncio counterpart of SQLStorage for services that aren't the Tk app.
+        reads are spread over a small pool of connections and run side by side
+        in threads, writes all go through a single writer connection one at a
+        time. SQLStorage keeps the database in WAL so readers never wait on the writer.
+
+        use it as:  storage = await AsyncSQLStorage.open()
+                    ...
+                    await storage.close()
+    '''
+    READERS = 4
+
+    def __init__(self, writer, readers):
+        # use open() instead, connecting is blocking work
+        self.writer = writer
+        self.write_lock = asyncio.Lock()
+        self.readers = asyncio.Queue()
+        for reader in readers:
+            self.readers.put_nowait(reader)
+        self.pool_size = len(readers)
+
+    @classmethod
+    async def open(cls, filename=None, readers=READERS):
+        ''' connect the writer and the reader pool
+        '''
+        def connect():
+            # no identity maps, a reader's cache would go stale as soon as the writer commits
+            writer = SQLStorage(filename, cache_size=0, check_same_thread=False)
+            pool = [SQLStorage(filename, cache_size=0, check_same_thread=False) for _ in range(readers)]
+            return writer, pool
+        writer, pool = await asyncio.to_thread(connect)
+        return cls(writer, pool)
+
+    async def read(self, method, *args):
+        ''' run a SQLStorage read on whichever pooled connection is free
+        '''
+        storage = await self.readers.get()
+        try:
+            return await asyncio.to_thread(getattr(storage, method), *args)
+        finally:
+            self.readers.put_nowait(storage)
+
+    async def write(self, method, *args):
+        ''' run a SQLStorage write on the writer, one write at a time
+        '''
+        async with self.write_lock:
+            return await asyncio.to_thread(getattr(self.writer, method), *args)
+
+    # hotel booking
+    async def get_record_booking(self, rid):
+        return await self.read('get_record_booking', rid)
+
+    async def get_all_records_booking(self):
+        return await self.read('get_all_records_booking')
+
+    async def save_record_booking(self, record):
+        return await self.write('save_record_booking', record)
+
+    async def delete_record_booking(self, rid):
+        return await self.write('delete_record_booking', rid)
+
+    # inventory
+    async def get_record_inventory(self, rid):
+        return await self.read('get_record_inventory', rid)
+
+    async def get_all_records_inventory(self):
+        return await self.read('get_all_records_inventory')
+
+    async def save_record_inventory(self, record):
+        return await self.write('save_record_inventory', record)
+
+    async def delete_record_inventory(self, rid):
+        return await self.write('delete_record_inventory', rid)
+
+    async def close(self):
+        ''' wait for the readers to come back, then clean up every connection
+        '''
+        async with self.write_lock:
+            pool = [await self.readers.get() for _ in range(self.pool_size)]
+            for storage in [self.writer] + pool:
+                await asyncio.to_thread(storage.cleanup)
+                storage.conn.close()
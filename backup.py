@@ -0,0 +1,148 @@
+''' online backups of sql_data.db while the app keeps using it
+
+    copying the file while something is writing to it can give a torn copy,
+    so backups go through sqlite's backup api instead: a few pages per step
+    from a connection of their own, with a short pause between steps so
+    the app's writes get in between. a backup is written next to its target
+    and only renamed into place once it is complete.
+    BackupScheduler takes one every so often on a background thread and
+    keeps the newest few.
+'''
+import glob
+import os
+import sqlite3
+import threading
+import time
+
+PAGES = 256         # pages copied per step, 1 MB with the default 4 KB pages
+PAUSE = 0.005       # seconds between steps, when writers can get at the db
+KEEP = 24           # snapshots kept by the scheduler
+STALE_PART = 600    # seconds since a .part file was written before prune takes it for abandoned
+
+
+def backup(source, target, pages=PAGES, pause=PAUSE, progress=None, timeout=5.0):
+    ''' copy the database at path source to path target and return a report.
+        progress(report) is called after every step on the calling thread with
+        the pages copied so far, the total and the throughput
+    '''
+    start = time.perf_counter()
+    part = target + '.part'
+    if os.path.exists(part):
+        os.remove(part)     # left over from a backup that was interrupted
+    report = {'target': target, 'pages': 0, 'total_pages': 0, 'bytes': 0, 'seconds': 0.0, 'mb_per_sec': 0.0}
+    src = sqlite3.connect(source, timeout=timeout)
+    try:
+        page_size = src.execute("""PRAGMA page_size;""").fetchone()[0]
+        dst = sqlite3.connect(part)
+
+        def step(status, remaining, total):
+            report['total_pages'] = total
+            report['pages'] = total - remaining
+            report['bytes'] = report['pages'] * page_size
+            report['seconds'] = time.perf_counter() - start
+            if report['seconds'] > 0:
+                report['mb_per_sec'] = report['bytes'] / report['seconds'] / 1e6
+            if progress is not None:
+                progress(dict(report))
+            # sqlite only sleeps between steps when the db is busy, this is the gap for the app's writes
+            if remaining:
+                time.sleep(pause)
+
+        try:
+            src.backup(dst, pages=pages, progress=step, sleep=pause)
+            # the copy is in WAL mode like the source, fold it back into one file
+            dst.execute("""PRAGMA journal_mode=DELETE;""")
+        finally:
+            dst.close()
+    finally:
+        src.close()
+    os.replace(part, target)
+    report['bytes'] = os.path.getsize(target)
+    report['seconds'] = time.perf_counter() - start
+    report['mb_per_sec'] = report['bytes'] / report['seconds'] / 1e6 if report['seconds'] else 0.0
+    return report
+
+
+def snapshot_path(folder, source):
+    # sql_data.db -> folder/sql_data-20260101-120000.db, names sort oldest first
+    stem = os.path.splitext(os.path.basename(source))[0]
+    return os.path.join(folder, f"{stem}-{time.strftime('%Y%m%d-%H%M%S')}.db")
+
+
+def snapshots(folder, source):
+    ''' the snapshots of source in folder, oldest first
+    '''
+    stem = os.path.splitext(os.path.basename(source))[0]
+    return sorted(glob.glob(os.path.join(glob.escape(folder), f'{glob.escape(stem)}-*.db')))
+
+
+def prune(folder, source, keep=KEEP):
+    ''' delete all but the newest keep snapshots, and the .part files of
+        snapshots that were interrupted (the app closing mid backup leaves
+        one). returns the paths deleted
+    '''
+    doomed = snapshots(folder, source)[:-keep] if keep > 0 else []
+    stem = os.path.splitext(os.path.basename(source))[0]
+    # a backup still running keeps writing its .part, so only old ones go
+    doomed += [path for path in glob.glob(os.path.join(glob.escape(folder), f'{glob.escape(stem)}-*.db.part'))
+               if time.time() - os.path.getmtime(path) > STALE_PART]
+    for path in doomed:
+        os.remove(path)
+    return doomed
+
+
+def snapshot(folder, source, keep=KEEP, **kwargs):
+    ''' back source up into folder under a timestamped name and drop the
+        oldest snapshots beyond keep. takes the same keywords as backup()
+    '''
+    os.makedirs(folder, exist_ok=True)
+    report = backup(source, snapshot_path(folder, source), **kwargs)
+    report['pruned'] = prune(folder, source, keep)
+    return report
+
+
+class BackupScheduler():
+    ''' takes a snapshot every interval seconds on a background thread.
+        status is replaced with a fresh dict after every step, so the Tk
+        thread can read it from an after() poll without any locking
+    '''
+    def __init__(self, source, folder, interval=3600, keep=KEEP, pages=PAGES, pause=PAUSE):
+        self.source = source
+        self.folder = folder
+        self.interval = interval
+        self.keep = keep
+        self.pages = pages
+        self.pause = pause
+        self.status = {'state': 'waiting'}
+        self.stopping = threading.Event()
+        self.requested = threading.Event()      # set by backup_now()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while not self.stopping.is_set():
+            self.requested.wait(self.interval)
+            if self.stopping.is_set():
+                break
+            self.requested.clear()
+            try:
+                report = snapshot(self.folder, self.source, self.keep, pages=self.pages, pause=self.pause,
+                                  progress=self.on_progress)
+                self.status = dict(report, state='done', at=time.strftime('%H:%M:%S'))
+            except (sqlite3.Error, OSError) as e:
+                self.status = {'state': 'failed', 'error': str(e), 'at': time.strftime('%H:%M:%S')}
+
+    def on_progress(self, report):
+        self.status = dict(report, state='running')
+
+    def backup_now(self):
+        # don't wait for the interval, take one as soon as the thread is free
+        self.requested.set()
+
+    def stop(self, wait=True):
+        ''' no more snapshots, a running one is finished first when wait is set
+        '''
+        self.stopping.set()
+        self.requested.set()
+        if wait:
+            self.thread.join()
@@ -0,0 +1,86 @@
+''' memory benchmark for loading booking records
+
+    compares the old way of loading the table (a list of objects that each
+    carry a __dict__) with the __slots__ records built by the row factory,
+    and with streaming them through iter_records_booking.
+
+    usage: python bench_memory.py [--rows 1000000]
+'''
+import argparse
+import gc
+import os
+import tempfile
+import time
+import tracemalloc
+
+import init_db
+from models import SQLStorage
+
+
+class DictBooking():
+    # the Booking class as it was before __slots__, kept here to measure against
+    def __init__(self, room="", guests="", name="", email="", rid=0):
+        self.rid = rid
+        self.room = room
+        self.guests = guests
+        self.name = name
+        self.email = email
+
+
+def make_database(path, rows):
+    init_db.connect_database(path)
+    init_db.create_database()
+    init_db.cur.executemany("""INSERT INTO booking(room, guests, name, email) VALUES (?,?,?,?)""",
+                            ((str(100 + i % 400), str(1 + i % 4), f'guest {i}', f'guest{i}@example.com')
+                             for i in range(rows)))
+    init_db.close_database()
+
+
+def measure(label, rows, load):
+    ''' run load() under tracemalloc and report what it left behind and its peak
+    '''
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    kept = load()
+    seconds = time.perf_counter() - start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del kept
+    print(f'{label:<34}{current / rows:>10.1f} B/rec held {peak / rows:>10.1f} B/rec peak {seconds:>8.2f} s')
+
+
+def load_dicts(storage):
+    # what get_all_records_booking used to do
+    storage.data_access.execute("""SELECT * from booking;""")
+    return [DictBooking(row[1], row[2], row[3], row[4], row[0]) for row in storage.data_access]
+
+
+def stream(storage):
+    # touch every record but only hold one batch at a time
+    count = 0
+    for record in storage.iter_records_booking():
+        count += 1
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1000000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, 'bench.db')
+        print(f'building {args.rows} bookings ...')
+        make_database(path, args.rows)
+        storage = SQLStorage(path)
+        print(f'{"":<34}{"held":>20}{"peak":>21}')
+        measure('before: list of __dict__ objects', args.rows, lambda: load_dicts(storage))
+        measure('after: list of __slots__ records', args.rows, storage.get_all_records_booking)
+        measure('after: iter_records_booking', args.rows, lambda: stream(storage))
+        storage.cleanup()
+        storage.conn.close()
+
+
+if __name__ == '__main__':
+    main()
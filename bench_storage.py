@@ -0,0 +1,211 @@
+''' storage benchmark for SQLStorage and ShelveStorage
+
+    fills a fresh database of each kind with synthetic bookings and inventory
+    records, then times the operations the app uses: single saves, single
+    gets, get-all, sorted get-all, deletes and what a browse page refresh
+    costs after a few of the rows on screen are edited. nothing touches sql_data.db or project_data.db and no display is
+    needed. results are printed (or written with --out) as json so runs can
+    be compared.
+
+    usage: python bench_storage.py [--sizes 10000 100000] [--out results.json]
+'''
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+import init_db
+from models import SQLStorage, ShelveStorage, Booking, Inventory
+
+SAMPLE = 500        # single operations timed per run
+PAGE = 100          # rows the browse page loads for one window
+EDITS = 10          # rows on screen edited before the timed browse refresh
+
+
+def make_records(kind, count, rng):
+    ''' synthetic records, the same every run for a given seed
+    '''
+    if kind == 'booking':
+        return [Booking(room=str(rng.randint(100, 499)), guests=str(rng.randint(1, 4)),
+                        name=f'guest {i}', email=f'guest{i}@example.com') for i in range(count)]
+    items = ('towel', 'soap', 'pillow', 'blanket', 'shampoo', 'kettle', 'mug', 'hanger')
+    return [Inventory(item=f'{rng.choice(items)} {i % 1000}', quantity=str(rng.randint(0, 500)))
+            for i in range(count)]
+
+
+class SQLTarget():
+    ''' runs the benchmark operations against SQLStorage
+    '''
+    backend = 'sql'
+
+    def __init__(self, folder, kind):
+        path = os.path.join(folder, f'{kind}.db')
+        init_db.connect_database(path)
+        init_db.create_database()
+        init_db.close_database()
+        # no identity map, we want to time the database
+        self.storage = SQLStorage(path, cache_size=0)
+        self.kind = kind
+        self.table, self.key = ('booking', 'booking_id') if kind == 'booking' else ('items', 'item_id')
+        self.version = self.storage.get_change_version()
+        self.window = set()     # ids of the rows the browse page would be showing
+
+    def call(self, name, *args):
+        return getattr(self.storage, f'{name}_{self.kind}')(*args)
+
+    def load(self, records):
+        self.call('save_records', records)
+
+    def save(self, record):
+        self.call('save_record', record)
+
+    def get(self, rid):
+        return self.call('get_record', rid)
+
+    def get_all(self):
+        return self.call('get_all_records')
+
+    def get_all_sorted(self):
+        return self.call('get_all_sorted_records')
+
+    def delete(self, rid):
+        self.call('delete_record', rid)
+
+    def refresh(self):
+        ''' what BrowsePage.update costs the db: the change feed, then the row
+            count and fresh values for the edited rows in the window (see
+            VirtualTreeview.collect_changes), or after inserts and deletes the
+            count and the first window again, read by keyset like the app does
+        '''
+        self.version, changes = self.storage.get_changes_since(self.version)
+        changed = changes[self.table]
+        if not changed:
+            return []
+        self.call('count_records')
+        if all(op == 'update' for op in changed.values()):
+            return self.call('get_records_by_ids', [rid for rid in changed if rid in self.window])
+        records = self.call('get_page', PAGE, None, None, self.key, True)
+        self.window = {record.rid for record in records}
+        return records
+
+    def edit_window(self, rng):
+        # change a few of the rows on screen, the way an edit form would
+        records = self.call('get_records_by_ids', rng.sample(sorted(self.window), min(EDITS, len(self.window))))
+        for record in records:
+            if self.kind == 'booking':
+                record.guests = rng.randint(1, 4)
+            else:
+                record.quantity = rng.randint(0, 500)
+        self.call('save_records', records)
+
+    def close(self):
+        self.storage.cleanup()
+        self.storage.conn.close()
+
+
+class ShelveTarget():
+    ''' runs the benchmark operations against ShelveStorage
+    '''
+    backend = 'shelve'
+
+    def __init__(self, folder, kind):
+        self.storage = ShelveStorage(os.path.join(folder, f'{kind}.shelf'))
+
+    def load(self, records):
+        for record in records:
+            self.storage.save_record(record)
+        self.storage.flush()
+
+    def save(self, record):
+        self.storage.save_record(record)
+
+    def get(self, rid):
+        return self.storage.get_record(rid)
+
+    def get_all(self):
+        return self.storage.get_all_records()
+
+    def get_all_sorted(self):
+        return self.storage.get_all_sorted_records()
+
+    def delete(self, rid):
+        self.storage.delete_record(rid)
+
+    def refresh(self):
+        # a shelf can only refresh the browse page by reloading everything
+        return self.storage.get_all_sorted_records()
+
+    def edit_window(self, rng):
+        pass    # refresh reloads everything whatever changed
+
+    def close(self):
+        self.storage.cleanup()
+
+
+def timed(results, target, kind, size, op, count, run):
+    start = time.perf_counter()
+    run()
+    seconds = time.perf_counter() - start
+    results.append({'backend': target.backend, 'kind': kind, 'size': size, 'op': op, 'ops': count,
+                    'seconds': round(seconds, 6), 'per_op_ms': round(seconds * 1000 / count, 6)})
+    print(f'{target.backend:<7}{kind:<10}{size:>9} {op:<15}{seconds * 1000 / count:>12.4f} ms/op',
+          file=sys.stderr)
+
+
+def run_one(results, target_class, kind, size, seed):
+    rng = random.Random(seed)
+    with tempfile.TemporaryDirectory() as folder:
+        target = target_class(folder, kind)
+        records = make_records(kind, size, rng)
+        timed(results, target, kind, size, 'load', size, lambda: target.load(records))
+        rids = [record.rid for record in records]
+        extra = make_records(kind, SAMPLE, rng)
+        timed(results, target, kind, size, 'save', SAMPLE, lambda: [target.save(r) for r in extra])
+        picks = [rng.choice(rids) for _ in range(SAMPLE)]
+        timed(results, target, kind, size, 'get', SAMPLE, lambda: [target.get(rid) for rid in picks])
+        timed(results, target, kind, size, 'get_all', 1, target.get_all)
+        timed(results, target, kind, size, 'get_all_sorted', 1, target.get_all_sorted)
+        target.refresh()    # the first sql refresh also picks up the load from the change feed
+        target.edit_window(rng)
+        timed(results, target, kind, size, 'browse_refresh', 1, target.refresh)
+        doomed = rng.sample(rids, SAMPLE)
+        timed(results, target, kind, size, 'delete', SAMPLE, lambda: [target.delete(rid) for rid in doomed])
+        target.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--backends', nargs='+', choices=('sql', 'shelve'), default=['sql', 'shelve'])
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--out', help='write the json here instead of stdout')
+    args = parser.parse_args()
+
+    results = []
+    targets = {'sql': SQLTarget, 'shelve': ShelveTarget}
+    for size in args.sizes:
+        for backend in args.backends:
+            for kind in ('booking', 'inventory'):
+                run_one(results, targets[backend], kind, max(size, SAMPLE), args.seed)
+
+    report = {
+        'meta': {'python': platform.python_version(), 'sqlite': sqlite3.sqlite_version,
+                 'platform': platform.platform(), 'seed': args.seed, 'sample': SAMPLE,
+                 'time': time.strftime('%Y-%m-%dT%H:%M:%S')},
+        'results': results,
+    }
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+''' the first screen of the browse page saved to a small binary file
+
+    SQLStorage writes the rows the browse page opens on (the newest records
+    of each table, only the columns it shows) when it is cleaned up, and the
+    next start reads them back through mmap before the database is even
+    opened, so the window has rows in it straight away. the file carries the
+    change log version it was taken at, which is what the browse page checks
+    the db against before carrying on from there with the change feed.
+
+    layout, little endian: magic, change version (q), crc32 of the body (I),
+    body length (I), then the body: per table its name, row count (q),
+    rows saved (I) and columns (H), then every value as a one byte tag
+    (None / int / text) followed by a q or a length (I) and utf-8 bytes
+'''
+import mmap
+import os
+import struct
+import zlib
+
+MAGIC = b'BRWSNAP1'
+HEADER = struct.Struct('<8sqII')
+TABLE = struct.Struct('<qIH')
+NONE, INT, TEXT = 0, 1, 2
+INT_VALUE = struct.Struct('<Bq')
+TEXT_LENGTH = struct.Struct('<BI')
+NAME_LENGTH = struct.Struct('<H')
+
+
+def write(path, version, tables):
+    ''' save {table: (row count, rows)} taken at change log version. the file
+        is written beside path and renamed over it, so a reader never sees
+        half of one
+    '''
+    body = bytearray()
+    for name, (total, rows) in tables.items():
+        encoded = name.encode('utf-8')
+        body += NAME_LENGTH.pack(len(encoded)) + encoded
+        body += TABLE.pack(total, len(rows), len(rows[0]) if rows else 0)
+        for row in rows:
+            for value in row:
+                if value is None:
+                    body.append(NONE)
+                elif isinstance(value, int):
+                    body += INT_VALUE.pack(INT, value)
+                else:
+                    encoded = str(value).encode('utf-8')
+                    body += TEXT_LENGTH.pack(TEXT, len(encoded)) + encoded
+    part = f'{path}.{os.getpid()}.part'
+    with open(part, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, version, zlib.crc32(body), len(body)))
+        f.write(body)
+    os.replace(part, path)
+
+
+def read(path):
+    ''' return (version, {table: (row count, rows)}) from a snapshot file, or
+        None when there is no usable one: missing, another format, or not
+        matching its checksum
+    '''
+    try:
+        f = open(path, 'rb')
+    except OSError:
+        return None
+    with f:
+        if os.fstat(f.fileno()).st_size < HEADER.size:
+            return None
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            magic, version, crc, length = HEADER.unpack_from(data, 0)
+            if magic != MAGIC or HEADER.size + length != len(data):
+                return None
+            with memoryview(data) as view:
+                if zlib.crc32(view[HEADER.size:]) != crc:
+                    return None
+            return version, read_tables(data, HEADER.size)
+
+
+def read_tables(data, offset):
+    tables = {}
+    while offset < len(data):
+        size, = NAME_LENGTH.unpack_from(data, offset)
+        offset += NAME_LENGTH.size
+        name = data[offset:offset + size].decode('utf-8')
+        offset += size
+        total, count, columns = TABLE.unpack_from(data, offset)
+        offset += TABLE.size
+        rows = []
+        for _ in range(count):
+            row = []
+            for _ in range(columns):
+                tag = data[offset]
+                if tag == NONE:
+                    row.append(None)
+                    offset += 1
+                elif tag == INT:
+                    row.append(INT_VALUE.unpack_from(data, offset)[1])
+                    offset += INT_VALUE.size
+                else:
+                    size = TEXT_LENGTH.unpack_from(data, offset)[1]
+                    offset += TEXT_LENGTH.size
+                    row.append(data[offset:offset + size].decode('utf-8'))
+                    offset += size
+            rows.append(tuple(row))
+        tables[name] = (total, rows)
+    return tables
@@ -0,0 +1,222 @@
+import bisect
+import csv
+import json
+import time
+from models import Booking, Inventory, check_stay
+
+# how many rows are saved per transaction / pulled per fetchmany
+CHUNK_SIZE = 1000
+# only the first few bad rows are kept for the report, the rest are just counted
+MAX_ERRORS = 100
+# the biggest number sqlite stores as an integer
+MAX_INTEGER = 2 ** 63 - 1
+
+# the columns written out for each kind of record, in file order
+FIELDS = {
+    'booking': ('booking_id', 'room', 'guests', 'name', 'email', 'check_in', 'check_out'),
+    'inventory': ('item_id', 'item', 'quantity'),
+}
+
+
+def file_format(path, fmt=None):
+    ''' work out whether a file is csv or jsonl from its extension
+    '''
+    fmt = (fmt or path.rsplit('.', 1)[-1]).lower()
+    if fmt not in ('csv', 'jsonl'):
+        raise ValueError(f'unsupported format {fmt!r}, expected csv or jsonl')
+    return fmt
+
+
+def read_rows(path, fmt=None):
+    ''' yield (line number, row dict) for every row in the file, one at a time
+        rows that can't be parsed come back as the exception instead of a dict
+    '''
+    fmt = file_format(path, fmt)
+    with open(path, newline='', encoding='utf-8') as f:
+        if fmt == 'csv':
+            reader = csv.DictReader(f)
+            for row in reader:
+                yield reader.line_num, row
+        else:
+            for line_no, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except ValueError as e:
+                    yield line_no, e
+                    continue
+                if not isinstance(row, dict):
+                    row = ValueError('expected a json object')
+                yield line_no, row
+
+
+def required(row, field):
+    # pull a field out of a row, it has to be there and not blank
+    value = row.get(field)
+    if value is None or str(value).strip() == '':
+        raise ValueError(f'{field} is missing')
+    return str(value).strip()
+
+
+def whole_number(row, field):
+    # anything the db's INTEGER check would refuse has to be caught here, or it fails the whole chunk
+    value = required(row, field)
+    try:
+        number = int(value)
+    except ValueError:
+        number = None
+    if number is None or not 0 <= number <= MAX_INTEGER:
+        raise ValueError(f'{field} must be a whole number, got {value!r}')
+    return number
+
+
+def make_booking(row):
+    ''' turn a row from a file into a new Booking, raises ValueError if it is bad
+        ids in the file are ignored, imported records always get a new id.
+        the stay dates are optional, older files don't have them
+    '''
+    check_in, check_out = check_stay(row.get('check_in'), row.get('check_out'))
+    return Booking(room=required(row, 'room'), guests=whole_number(row, 'guests'),
+                   name=required(row, 'name'), email=required(row, 'email'),
+                   check_in=check_in, check_out=check_out)
+
+
+def make_inventory(row):
+    ''' turn a row from a file into a new Inventory record, raises ValueError if it is bad
+    '''
+    return Inventory(item=required(row, 'item'), quantity=whole_number(row, 'quantity'))
+
+
+def book_stay(stays, record):
+    ''' add record's stay to stays, {room: [(check_in, check_out)] sorted},
+        unless it shares a night with one already there. returns that one,
+        or None once it has been added
+    '''
+    taken = stays.setdefault(record.room, [])
+    # the stays in a room never overlap, so only the ones either side of where this goes can
+    i = bisect.bisect_left(taken, (record.check_in,))
+    if i > 0 and taken[i - 1][1] > record.check_in:
+        return taken[i - 1]
+    if i < len(taken) and taken[i][0] < record.check_out:
+        return taken[i]
+    taken.insert(i, (record.check_in, record.check_out))
+    return None
+
+
+def check_stay_free(storage, stays, record):
+    # the same double booking check the booking form makes, against the db and the rows read before this one
+    if not record.check_in:
+        return
+    conflicts = storage.get_booking_conflicts(record)
+    if conflicts:
+        raise ValueError(f'room {record.room} is already booked: '
+                         + ', '.join(f'{booking.rid} ({booking.check_in} to {booking.check_out})'
+                                     for booking in conflicts))
+    clash = book_stay(stays, record)
+    if clash is not None:
+        raise ValueError(f'room {record.room} is already booked by an earlier row: {clash[0]} to {clash[1]}')
+
+
+def import_file(storage, kind, path, fmt=None, chunk_size=CHUNK_SIZE, progress=None, check_stays=True):
+    ''' stream booking or inventory records from a csv/jsonl file into the db
+        rows are validated one at a time and saved chunk_size at a time, each
+        chunk in its own transaction. progress(report) is called after every chunk.
+        a booking whose stay overlaps another one for the room, in the db or
+        earlier in the file, is rejected like a bad row unless check_stays is
+        off. the check is made as rows are read, not under the chunk's write
+        lock, so it doesn't see bookings other machines make meanwhile.
+        returns a report dict with the counts, bad rows and throughput
+    '''
+    if kind == 'booking':
+        make, save = make_booking, storage.save_records_booking
+    elif kind == 'inventory':
+        make, save = make_inventory, storage.save_records_inventory
+    else:
+        raise ValueError(f'unknown record kind {kind!r}')
+
+    report = {'kind': kind, 'path': path, 'imported': 0, 'rejected': 0, 'errors': [],
+              'seconds': 0.0, 'rows_per_sec': 0.0}
+    start = time.perf_counter()
+
+    def flush(chunk):
+        save(chunk)
+        report['imported'] += len(chunk)
+        report['seconds'] = time.perf_counter() - start
+        if report['seconds']:
+            report['rows_per_sec'] = report['imported'] / report['seconds']
+        if progress:
+            progress(report)
+
+    chunk = []
+    stays = {}
+    for line_no, row in read_rows(path, fmt):
+        try:
+            if isinstance(row, Exception):
+                raise row
+            record = make(row)
+            if kind == 'booking' and check_stays:
+                check_stay_free(storage, stays, record)
+            chunk.append(record)
+        except ValueError as e:
+            report['rejected'] += 1
+            if len(report['errors']) < MAX_ERRORS:
+                report['errors'].append((line_no, str(e)))
+            continue
+        if len(chunk) >= chunk_size:
+            flush(chunk)
+            chunk = []
+    if chunk:
+        flush(chunk)
+
+    report['seconds'] = time.perf_counter() - start
+    if report['seconds']:
+        report['rows_per_sec'] = report['imported'] / report['seconds']
+    return report
+
+
+def iter_rows(storage, kind, batch_size=CHUNK_SIZE):
+    ''' yield every row of a table as a tuple in FIELDS order, oldest first
+        uses its own cursor and fetchmany so only one batch is in memory at a time
+    '''
+    if kind == 'booking':
+        sql = """SELECT booking_id, room, guests, name, email, check_in, check_out from booking ORDER BY booking_id;"""
+    elif kind == 'inventory':
+        sql = """SELECT item_id, item, quantity from items ORDER BY item_id;"""
+    else:
+        raise ValueError(f'unknown record kind {kind!r}')
+    cursor = storage.conn.cursor()
+    try:
+        cursor.execute(sql)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield from rows
+    finally:
+        cursor.close()
+
+
+def export_file(storage, kind, path, fmt=None, batch_size=CHUNK_SIZE):
+    ''' stream a whole table out to a csv/jsonl file
+        returns a report dict with the row count and throughput
+    '''
+    fmt = file_format(path, fmt)
+    fields = FIELDS[kind]
+    report = {'kind': kind, 'path': path, 'exported': 0, 'seconds': 0.0, 'rows_per_sec': 0.0}
+    start = time.perf_counter()
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        if fmt == 'csv':
+            writer = csv.writer(f)
+            writer.writerow(fields)
+            for row in iter_rows(storage, kind, batch_size):
+                writer.writerow(row)
+                report['exported'] += 1
+        else:
+            for row in iter_rows(storage, kind, batch_size):
+                f.write(json.dumps(dict(zip(fields, row))) + '\n')
+                report['exported'] += 1
+    report['seconds'] = time.perf_counter() - start
+    if report['seconds']:
+        report['rows_per_sec'] = report['exported'] / report['seconds']
+    return report
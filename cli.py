@@ -0,0 +1,284 @@
+''' command line access to sql_data.db for scripts and batch jobs
+
+    the same SQLStorage the app uses, without tkinter or any window, so it
+    starts in a few tens of ms. records are printed one per line with tabs
+    between the fields (--json for json), ids are what the app shows.
+
+    usage: python cli.py [--db sql_data.db] [--timeout 5] [--json] <command> ...
+        list booking|inventory [--limit 50] [--after ID] [--search TEXT]
+        get booking|inventory ID
+        add booking --room R --guests N --name NAME --email EMAIL [--check-in DATE --check-out DATE]
+        add inventory --item ITEM --quantity N
+        delete booking|inventory ID [ID ...]
+        import booking|inventory FILE [--format csv|jsonl] [--no-stay-check]
+        export booking|inventory FILE [--format csv|jsonl]
+        free-rooms CHECK_IN CHECK_OUT
+        stats
+        backup FILE | --folder DIR [--keep 24]
+        repair [--set booking|inventory ID N] [--leading]
+'''
+import argparse
+import json
+import os
+import re
+import sqlite3
+import sys
+
+import backup
+import bulk_io
+import init_db
+from models import SQLStorage
+
+KINDS = ('booking', 'inventory')
+# record attributes printed for each kind, in the same order as the export files
+ATTRS = {
+    'booking': ('rid', 'room', 'guests', 'name', 'email', 'check_in', 'check_out'),
+    'inventory': ('rid', 'item', 'quantity'),
+}
+# the number a bit of free text starts with, "2 adults" -> 2 but not "2.5" or "-1"
+LEADING_NUMBER = re.compile(r'\s*(\d{1,18})(?![\d.,])')
+
+
+def values(kind, record):
+    return tuple(getattr(record, attr) for attr in ATTRS[kind])
+
+
+def show_records(args, records):
+    if args.json:
+        fields = bulk_io.FIELDS[args.kind]
+        for record in records:
+            print(json.dumps(dict(zip(fields, values(args.kind, record)))))
+    else:
+        for record in records:
+            print('\t'.join('' if value is None else str(value) for value in values(args.kind, record)))
+
+
+def show(args, report):
+    # a dict of results, one "key: value" line each unless --json
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        for key, value in report.items():
+            print(f'{key}: {value}')
+
+
+def cmd_list(storage, args):
+    # newest first like the browse page, --after continues from the last id printed
+    if args.search:
+        records = getattr(storage, f'search_{args.kind}')(args.search, args.limit, after_rid=args.after)
+    else:
+        records = getattr(storage, f'get_page_{args.kind}')(args.limit, after_rid=args.after, descending=True)
+    show_records(args, records)
+
+
+def cmd_get(storage, args):
+    record = getattr(storage, f'get_record_{args.kind}')(args.id)
+    if record is None:
+        raise LookupError(f'no {args.kind} record with id {args.id}')
+    show_records(args, [record])
+
+
+def cmd_add(storage, args):
+    # the same checks the importer uses
+    if args.kind == 'booking':
+        record = bulk_io.make_booking({'room': args.room, 'guests': args.guests, 'name': args.name,
+                                       'email': args.email, 'check_in': args.check_in,
+                                       'check_out': args.check_out})
+        # a stay is only saved if the room is free, same as the booking form
+        conflicts = storage.save_record_booking_checked(record)
+        if conflicts:
+            raise ValueError(f'room {record.room} is already booked: '
+                             + ', '.join(f'{booking.rid} ({booking.check_in} to {booking.check_out})'
+                                         for booking in conflicts))
+    else:
+        record = bulk_io.make_inventory({'item': args.item, 'quantity': args.quantity})
+        storage.save_record_inventory(record)
+    print(record.rid)
+
+
+def cmd_delete(storage, args):
+    getattr(storage, f'delete_records_{args.kind}')(args.ids)
+
+
+def progress(report):
+    print(f"\r{report['imported']} rows, {report['rows_per_sec']:.0f} rows/s", end='', file=sys.stderr)
+
+
+def cmd_import(storage, args):
+    report = bulk_io.import_file(storage, args.kind, args.file, args.format,
+                                 progress=progress if sys.stderr.isatty() else None,
+                                 check_stays=not args.no_stay_check)
+    if sys.stderr.isatty():
+        print(file=sys.stderr)
+    for line_no, error in report.pop('errors'):
+        print(f'{args.file}:{line_no}: {error}', file=sys.stderr)
+    show(args, report)
+
+
+def cmd_export(storage, args):
+    show(args, bulk_io.export_file(storage, args.kind, args.file, args.format))
+
+
+def cmd_free_rooms(storage, args):
+    for room in storage.get_free_rooms(args.check_in, args.check_out):
+        print(room)
+
+
+def cmd_stats(storage, args):
+    quantity, records = storage.get_stock_total()
+    show(args, {
+        'db': args.db,
+        'size_bytes': os.path.getsize(args.db),
+        'schema_version': storage.conn.execute("""PRAGMA user_version;""").fetchone()[0],
+        'change_version': storage.get_change_version(),
+        'bookings': storage.count_records_booking(),
+        'inventory_records': storage.count_records_inventory(),
+        'total_stock': quantity,
+        'low_stock_items': len(storage.get_low_stock(limit=-1)),
+    })
+
+
+def backup_progress(report):
+    print(f"\r{report['pages']}/{report['total_pages']} pages, {report['mb_per_sec']:.1f} MB/s",
+          end='', file=sys.stderr)
+
+
+def cmd_backup(storage, args):
+    # copies through sqlite's backup api, so the app can keep writing while it runs
+    if (args.file is None) == (args.folder is None):
+        raise ValueError('give either a backup file or --folder')
+    progress = backup_progress if sys.stderr.isatty() else None
+    if args.folder is not None:
+        report = backup.snapshot(args.folder, args.db, args.keep, progress=progress, timeout=args.timeout)
+    else:
+        report = backup.backup(args.db, args.file, progress=progress, timeout=args.timeout)
+    if sys.stderr.isatty():
+        print(file=sys.stderr)
+    show(args, report)
+
+
+def cmd_repair(conn, args):
+    ''' list the rows whose guests or quantity the upgrade can't turn into a
+        whole number, after setting the ones asked for. works on the plain
+        connection, the db can't be opened through SQLStorage until they're fixed
+    '''
+    columns = {table: (key, column) for table, key, column in init_db.WHOLE_NUMBER_COLUMNS}
+    if args.set:
+        kind, rid, value = args.set
+        if kind not in KINDS:
+            raise ValueError(f'kind must be booking or inventory, got {kind!r}')
+        table = 'booking' if kind == 'booking' else 'items'
+        key, column = columns[table]
+        number = bulk_io.whole_number({column: value}, column)
+        if conn.execute(f'''UPDATE {table} SET {column} = ? WHERE {key} = ?;''',
+                        (str(number), int(rid))).rowcount == 0:
+            raise LookupError(f'no {kind} record with id {rid}')
+    if args.leading:
+        for table, rid, column, value in init_db.bad_whole_numbers(conn):
+            match = LEADING_NUMBER.match(str(value))
+            if match:
+                conn.execute(f'''UPDATE {table} SET {column} = ? WHERE {columns[table][0]} = ?;''',
+                             (match.group(1), rid))
+    conn.commit()
+    for table, rid, column, value in init_db.bad_whole_numbers(conn):
+        if args.json:
+            print(json.dumps({'table': table, 'id': rid, 'column': column, 'value': value}))
+        else:
+            print(f'{table}\t{rid}\t{column}\t{value}')
+
+
+def make_parser():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', default=SQLStorage.FILENAME)
+    parser.add_argument('--timeout', type=float, default=SQLStorage.BUSY_TIMEOUT,
+                        help='seconds to wait for another connection to finish writing')
+    parser.add_argument('--json', action='store_true', help='print json instead of tab separated lines')
+    parser.set_defaults(plain=False)     # commands that get a sqlite3 connection instead of SQLStorage
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    command = commands.add_parser('list', help='print records, newest first')
+    command.add_argument('kind', choices=KINDS)
+    command.add_argument('--limit', type=int, default=50)
+    command.add_argument('--after', type=int, help='carry on after this id')
+    command.add_argument('--search', help='only records matching this text')
+    command.set_defaults(run=cmd_list)
+
+    command = commands.add_parser('get', help='print one record')
+    command.add_argument('kind', choices=KINDS)
+    command.add_argument('id', type=int)
+    command.set_defaults(run=cmd_get)
+
+    command = commands.add_parser('add', help='add a record and print its id')
+    kinds = command.add_subparsers(dest='kind', required=True)
+    booking = kinds.add_parser('booking')
+    for field in ('room', 'guests', 'name', 'email'):
+        booking.add_argument(f'--{field}', required=True)
+    booking.add_argument('--check-in', help='YYYY-MM-DD')
+    booking.add_argument('--check-out', help='YYYY-MM-DD, the day they leave')
+    inventory = kinds.add_parser('inventory')
+    for field in ('item', 'quantity'):
+        inventory.add_argument(f'--{field}', required=True)
+    command.set_defaults(run=cmd_add)
+
+    command = commands.add_parser('delete', help='delete records by id')
+    command.add_argument('kind', choices=KINDS)
+    command.add_argument('ids', type=int, nargs='+')
+    command.set_defaults(run=cmd_delete)
+
+    for name, run in (('import', cmd_import), ('export', cmd_export)):
+        command = commands.add_parser(name, help=f'{name} a csv or jsonl file')
+        command.add_argument('kind', choices=KINDS)
+        command.add_argument('file')
+        command.add_argument('--format', choices=('csv', 'jsonl'), help='default is the file extension')
+        if name == 'import':
+            command.add_argument('--no-stay-check', action='store_true',
+                                 help="import bookings even when the room is already booked for their dates")
+        command.set_defaults(run=run)
+
+    command = commands.add_parser('free-rooms', help='rooms with no booking between two dates')
+    command.add_argument('check_in', help='YYYY-MM-DD')
+    command.add_argument('check_out', help='YYYY-MM-DD')
+    command.set_defaults(run=cmd_free_rooms)
+
+    command = commands.add_parser('stats', help='record counts and stock totals')
+    command.set_defaults(run=cmd_stats)
+
+    command = commands.add_parser('backup', help='copy the db while it is in use')
+    command.add_argument('file', nargs='?', help='write the copy here')
+    command.add_argument('--folder', help='or into this folder under a timestamped name')
+    command.add_argument('--keep', type=int, default=backup.KEEP, help='snapshots to keep in --folder')
+    command.set_defaults(run=cmd_backup)
+
+    command = commands.add_parser('repair', help="list or fix the rows that stop the db upgrading")
+    command.add_argument('--set', nargs=3, metavar=('KIND', 'ID', 'N'),
+                         help='set the guests of a booking or the quantity of an inventory record')
+    command.add_argument('--leading', action='store_true',
+                         help='use the number free text starts with, "2 adults" becomes 2')
+    command.set_defaults(run=cmd_repair, plain=True)
+    return parser
+
+
+def main(argv=None):
+    args = make_parser().parse_args(argv)
+    storage = conn = None
+    try:
+        # opening can fail too (no such file, locked, a db that won't upgrade), that's an error line as well
+        if args.plain:
+            conn = sqlite3.connect(args.db, timeout=args.timeout)
+            args.run(conn, args)
+        else:
+            storage = SQLStorage(args.db, cache_size=0, timeout=args.timeout)
+            args.run(storage, args)
+    except (LookupError, ValueError, sqlite3.Error, OSError) as e:
+        print(f'error: {e}', file=sys.stderr)
+        return 1
+    finally:
+        if storage is not None:
+            storage.cleanup()
+            storage.conn.close()
+        if conn is not None:
+            conn.close()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,2 @@
+# pytest puts the folder of this file on sys.path, so the tests under tests/ can import
+# the app's modules (models, init_db, cli, ...) however pytest is started
@@ -0,0 +1,166 @@
+import queue
+import threading
+import traceback
+
+
+class Request():
+    ''' one call waiting for the worker, plus everyone who wants its result
+    '''
+    def __init__(self, method, args, key, background=False):
+        self.method = method
+        self.args = args
+        self.key = key
+        self.background = background    # doesn't count as outstanding work
+        self.callbacks = []
+        self.errbacks = []
+
+
+class DatabaseExecutor():
+    ''' runs every storage call on one worker thread that owns the sqlite
+        connection, so the Tk mainloop never waits on the database.
+        requests go in through a queue and results come back to the Tk thread
+        by polling with after()
+    '''
+    POLL_MS = 15
+    IDLE_SECONDS = 0.25     # how often an idle worker gives the storage a chance to flush
+
+    def __init__(self, widget, make_storage, on_busy=None, on_error=None):
+        # make_storage is called on the worker thread because a sqlite
+        # connection can only be used by the thread that opened it
+        self.widget = widget        # any tk widget, only used for after()
+        self.on_busy = on_busy      # on_busy(True / False) when work starts / runs out
+        self.on_error = on_error    # for failed requests that have no errback of their own
+        self.requests = queue.Queue()
+        self.results = queue.Queue()
+        self.waiting = {}   # coalescing key -> request that hasn't started yet
+        self.lock = threading.Lock()
+        self.outstanding = 0    # submitted but not delivered yet, only touched on the tk thread
+        self.running = True
+        self.thread = threading.Thread(target=self.run, args=(make_storage,), daemon=True)
+        self.thread.start()
+        self.widget.after(self.POLL_MS, self.poll)
+
+    def submit(self, method, *args, callback=None, errback=None, key=None, background=False):
+        ''' queue storage.method(*args) for the worker. method is either the name
+            of a storage method or a function that gets the storage as its first
+            argument. callback(result) and errback(exception) run on the tk thread.
+            requests that share a key and haven't started yet collapse into one
+            call with the newest arguments, and every callback gets that result.
+            background requests (timed polls nobody is waiting on) don't make
+            the app look busy
+        '''
+        count = False
+        with self.lock:
+            request = self.waiting.get(key) if key is not None else None
+            new = request is None
+            if new:
+                request = Request(method, args, key, background)
+                count = not background
+                if key is not None:
+                    self.waiting[key] = request
+            else:
+                request.method, request.args = method, args
+                if request.background and not background:
+                    # someone is waiting on it now
+                    request.background = False
+                    count = True
+            if callback is not None and callback not in request.callbacks:
+                request.callbacks.append(callback)
+            if errback is not None and errback not in request.errbacks:
+                request.errbacks.append(errback)
+        if count:
+            self.set_outstanding(1)
+        if new:
+            self.requests.put(request)
+
+    def run(self, make_storage):
+        ''' the worker thread: open the storage, then work through the queue
+            until shutdown() sends None
+        '''
+        storage, failure = None, None
+        try:
+            storage = make_storage()
+        except Exception as e:
+            failure = e     # every request will report this instead
+        while True:
+            try:
+                request = self.requests.get(timeout=self.IDLE_SECONDS)
+            except queue.Empty:
+                self.idle(storage)
+                continue
+            if request is None:
+                break
+            with self.lock:
+                # from here on a new submit with this key starts a new request
+                if request.key is not None and self.waiting.get(request.key) is request:
+                    del self.waiting[request.key]
+                method, args = request.method, request.args
+            try:
+                if storage is None:
+                    raise failure
+                if isinstance(method, str):
+                    result = getattr(storage, method)(*args)
+                else:
+                    result = method(storage, *args)
+                self.results.put((request, result, None))
+            except Exception as e:
+                self.results.put((request, None, e))
+        if storage is not None:
+            storage.cleanup()
+
+    def idle(self, storage):
+        # a storage holding writes back (SQLStorage write_behind) flushes them once they are old enough
+        flush_if_due = getattr(storage, 'flush_if_due', None)
+        if flush_if_due is None:
+            return
+        try:
+            flush_if_due()
+        except Exception as e:
+            # nobody asked for this, so the error goes to on_error
+            self.results.put((None, None, e))
+
+    def poll(self):
+        ''' hand finished results to their callbacks on the tk thread
+        '''
+        if self.running:
+            self.widget.after(self.POLL_MS, self.poll)
+        while True:
+            try:
+                request, result, error = self.results.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                if request is None:     # from idle(), wasn't counted as outstanding
+                    if self.on_error is not None:
+                        self.on_error(error)
+                    else:
+                        traceback.print_exception(error)
+                    continue
+                if not request.background:
+                    self.set_outstanding(-1)
+                if error is None:
+                    for callback in request.callbacks:
+                        callback(result)
+                elif request.errbacks:
+                    for errback in request.errbacks:
+                        errback(error)
+                elif self.on_error is not None:
+                    self.on_error(error)
+                else:
+                    traceback.print_exception(error)
+            except Exception:
+                # one broken callback shouldn't stop every later result
+                traceback.print_exc()
+
+    def set_outstanding(self, change):
+        was_busy = self.outstanding > 0
+        self.outstanding += change
+        if self.on_busy is not None and was_busy != (self.outstanding > 0):
+            self.on_busy(self.outstanding > 0)
+
+    def shutdown(self):
+        ''' let the worker finish what is queued, clean up the storage and stop
+        '''
+        self.running = False
+        self.requests.put(None)
+        self.thread.join()
@@ -3,7 +3,10 @@ import sys
 
 
 class EntryField(tk.Frame):
-    def __init__(self, parent, label='', passwordField=False, *args, **kwargs):
+    SUGGEST_DELAY_MS = 150  # how long typing has to pause before asking for suggestions
+    SUGGEST_ROWS = 8        # height of the suggestion list
+
+    def __init__(self, parent, label='', passwordField=False, *args, suggest=None, **kwargs):
         # keep in mind EntryField is a Frame widget so any args and kwargs apply only to it, not its children - the label and title
         super().__init__(parent, *args, **kwargs)
         self.dataentry = tk.StringVar()
@@ -20,8 +23,92 @@ class EntryField(tk.Frame):
                 self, width=30, textvariable=self.dataentry)
         self.field.grid(row=0, column=1, padx=15, sticky=(tk.W + tk.E))
 
+        # autocomplete: suggest(text, show) has to look text up somewhere that isn't the tk thread
+        # and call show(text, values) back on it, e.g. through the db worker
+        self.suggest = suggest
+        self.suggest_job = None     # pending after() call for the debounced lookup
+        self.popup = None           # the suggestion list, a borderless window under the entry
+        self.choices = None
+        if suggest is not None:
+            self.field.bind('<KeyRelease>', self.on_key)
+            self.field.bind('<Down>', self.focus_suggestions)
+            self.field.bind('<Escape>', lambda event: self.hide_suggestions())
+            self.field.bind('<FocusOut>', self.on_focus_out)
+
     def reset(self):
         self.dataentry.set("")
+        self.hide_suggestions()
 
     def get(self):
         return self.dataentry.get()
+
+    def on_key(self, event):
+        # every keystroke pushes the lookup back, so it only runs once typing pauses
+        if event.keysym in ('Up', 'Down', 'Left', 'Right', 'Return', 'Escape', 'Tab'):
+            return
+        if self.suggest_job is not None:
+            self.after_cancel(self.suggest_job)
+        self.suggest_job = self.after(self.SUGGEST_DELAY_MS, self.ask_suggestions)
+
+    def ask_suggestions(self):
+        self.suggest_job = None
+        text = self.get()
+        if not text.strip():
+            self.hide_suggestions()
+            return
+        self.suggest(text, self.show_suggestions)
+
+    def show_suggestions(self, text, values):
+        ''' list values under the entry. answers for text that has been typed
+            over since are dropped
+        '''
+        if text != self.get() or self.focus_get() is not self.field:
+            return
+        values = [value for value in values if value != text]
+        if not values:
+            self.hide_suggestions()
+            return
+        if self.popup is None:
+            self.popup = tk.Toplevel(self)
+            self.popup.overrideredirect(True)
+            self.choices = tk.Listbox(self.popup, width=self.field.cget('width'), height=self.SUGGEST_ROWS)
+            self.choices.pack()
+            self.choices.bind('<ButtonRelease-1>', self.pick)
+            self.choices.bind('<Return>', self.pick)
+            self.choices.bind('<Escape>', lambda event: self.hide_suggestions(refocus=True))
+            self.choices.bind('<FocusOut>', self.on_focus_out)
+        self.choices.delete(0, tk.END)
+        self.choices.insert(tk.END, *values)
+        self.choices.config(height=min(len(values), self.SUGGEST_ROWS))
+        self.popup.geometry(f"+{self.field.winfo_rootx()}+{self.field.winfo_rooty() + self.field.winfo_height()}")
+        self.popup.deiconify()
+        self.popup.lift()
+
+    def focus_suggestions(self, event):
+        # down arrow from the entry moves into the list
+        if self.popup is not None and self.popup.winfo_viewable():
+            self.choices.focus_set()
+            self.choices.selection_clear(0, tk.END)
+            self.choices.selection_set(0)
+            self.choices.activate(0)
+            return "break"
+
+    def pick(self, event):
+        selection = self.choices.curselection()
+        if selection:
+            self.dataentry.set(self.choices.get(selection[0]))
+            self.field.icursor(tk.END)
+        self.hide_suggestions(refocus=True)
+
+    def on_focus_out(self, event):
+        # focus moves into the list for a moment when it is clicked, only hide once it has gone elsewhere
+        self.after(100, lambda: self.focus_get() not in (self.field, self.choices) and self.hide_suggestions())
+
+    def hide_suggestions(self, refocus=False):
+        if self.suggest_job is not None:
+            self.after_cancel(self.suggest_job)
+            self.suggest_job = None
+        if self.popup is not None:
+            self.popup.withdraw()
+        if refocus:
+            self.field.focus_set()
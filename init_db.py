@@ -1,33 +1,394 @@
 import sqlite3
+import sys
 
+# rows copied per transaction when a migration has to rebuild a table
+BATCH_SIZE = 10000
 
-def connect_database():
+
+def connect_database(filename='sql_data.db'):
     global conn, cur
 
     # will connect to db if exists, or create a new one.
-    conn = sqlite3.connect('sql_data.db')
+    conn = sqlite3.connect(filename)
 
     cur = conn.cursor()
 
 
-def create_database():# first database for hotel booking
-    cur.execute('''DROP TABLE IF EXISTS booking;''')
-    cur.execute('''CREATE TABLE IF NOT EXISTS "booking" (
+def create_database(progress=None):
+    # brings the tables up to date without dropping anything, safe to run on a live db.
+    # progress(message) gets each step, by default they go to stderr so stdout stays clean
+    migrate(conn, progress=progress or (lambda message: print(message, file=sys.stderr)))
+
+
+def create_tables(c, batch_size, progress):# first database for hotel booking
+    c.execute('''CREATE TABLE IF NOT EXISTS "booking" (
             "booking_id"	INTEGER PRIMARY KEY,
             "room" TEXT NOT NULL,
             "guests" TEXT NOT NULL,
             "name"	TEXT NOT NULL,
             "email"	TEXT NOT NULL
             );''')
-    
+
     # second database for inventory management
-    cur.execute('''DROP TABLE IF EXISTS items;''')
-    cur.execute('''CREATE TABLE IF NOT EXISTS "items" (
+    c.execute('''CREATE TABLE IF NOT EXISTS "items" (
             "item_id"	INTEGER PRIMARY KEY,
             "quantity" TEXT NOT NULL,
             "item"	TEXT NOT NULL
             );''')
-    
+
+
+def create_change_log_triggers(c, table, key):
+    # the triggers belong to the table, so a rebuilt table needs them again
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS {table}_insert_log AFTER INSERT ON {table} BEGIN
+            INSERT OR REPLACE INTO change_log(tbl, rid, op) VALUES ('{table}', NEW.{key}, 'insert');
+            END;''')
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS {table}_update_log AFTER UPDATE ON {table} BEGIN
+            INSERT OR REPLACE INTO change_log(tbl, rid, op) VALUES ('{table}', NEW.{key}, 'update');
+            END;''')
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS {table}_delete_log AFTER DELETE ON {table} BEGIN
+            INSERT OR REPLACE INTO change_log(tbl, rid, op) VALUES ('{table}', OLD.{key}, 'delete');
+            END;''')
+
+
+def create_change_log(c, batch_size, progress):
+    # triggers record which rows were inserted, updated or deleted so the browse
+    # page can apply just those changes. each row only keeps its latest change,
+    # and seq doubles as the version token
+    c.execute('''CREATE TABLE IF NOT EXISTS "change_log" (
+            "seq"	INTEGER PRIMARY KEY AUTOINCREMENT,
+            "tbl"	TEXT NOT NULL,
+            "rid"	INTEGER NOT NULL,
+            "op"	TEXT NOT NULL,
+            UNIQUE ("tbl", "rid")
+            );''')
+    create_change_log_triggers(c, 'booking', 'booking_id')
+    create_change_log_triggers(c, 'items', 'item_id')
+
+
+def table_exists(c, table):
+    return c.execute('''SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?;''', (table,)).fetchone() is not None
+
+
+def copy_in_batches(c, source, target, key, select, batch_size, progress):
+    ''' copy every row of source into target a batch at a time, committing after
+        each one. it starts after the highest key already copied, so a copy that
+        was interrupted just carries on where it stopped, and two connections
+        copying at once share the work. returns False when target has gone,
+        another connection finished the migration in the meantime
+    '''
+    while True:
+        # each batch under the write lock, so the highest key can't move before the insert
+        c.execute('''BEGIN IMMEDIATE;''')
+        if not table_exists(c, target):
+            c.commit()
+            return False
+        last = c.execute(f'''SELECT COALESCE(MAX({key}), 0) FROM {target};''').fetchone()[0]
+        copied = c.execute(f'''INSERT INTO {target} SELECT {select} FROM {source}
+                WHERE {key} > ? ORDER BY {key} LIMIT ?;''', (last, batch_size)).rowcount
+        c.commit()
+        if copied == 0:
+            return True
+        progress(f'  {source}: copied {copied} rows after id {last}')
+
+
+# the columns typed_columns turns into whole numbers
+WHOLE_NUMBER_COLUMNS = (('booking', 'booking_id', 'guests'), ('items', 'item_id', 'quantity'))
+# text sqlite will turn into the same whole number, nothing lost. 18 digits always fits in 64 bits
+WHOLE_NUMBER = "trim({0}) != '' AND trim({0}) NOT GLOB '*[^0-9]*' AND length(trim({0})) <= 18"
+
+
+def bad_whole_numbers(c):
+    ''' (table, id, column, value) for every row whose guests or quantity
+        isn't a whole number. only a db from before typed_columns can have
+        any, afterwards the column constraints keep them out
+    '''
+    if c.execute('''PRAGMA user_version;''').fetchone()[0] > 2:
+        return []
+    bad = []
+    for table, key, column in WHOLE_NUMBER_COLUMNS:
+        if table_exists(c, table):
+            bad += [(table, rid, column, value) for rid, value in c.execute(
+                f'''SELECT {key}, {column} FROM {table} WHERE NOT ({WHOLE_NUMBER.format(column)});''')]
+    return bad
+
+
+def check_whole_numbers(c):
+    ''' raise ValueError listing the rows whose guests or quantity isn't a
+        whole number, rather than have the rebuild guess what they meant
+    '''
+    bad = [f'{table} {rid} {column} {value!r}' for table, rid, column, value in bad_whole_numbers(c)]
+    if bad:
+        raise ValueError(f"can't upgrade the db, {len(bad)} rows don't hold a whole number: "
+                         + ', '.join(bad[:10]) + (', ...' if len(bad) > 10 else '')
+                         + '. fix them with python cli.py repair and open it again')
+
+
+def create_migrate_log(c, table, key):
+    # rows written to table while it is being copied, so the copy can catch up with them before the swap
+    c.execute(f'''CREATE TABLE IF NOT EXISTS "{table}_migrate_log" ("rid" INTEGER PRIMARY KEY);''')
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS {table}_migrate_insert AFTER INSERT ON {table} BEGIN
+            INSERT OR IGNORE INTO {table}_migrate_log VALUES (NEW.{key});
+            END;''')
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS {table}_migrate_update AFTER UPDATE ON {table} BEGIN
+            INSERT OR IGNORE INTO {table}_migrate_log VALUES (OLD.{key});
+            INSERT OR IGNORE INTO {table}_migrate_log VALUES (NEW.{key});
+            END;''')
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS {table}_migrate_delete AFTER DELETE ON {table} BEGIN
+            INSERT OR IGNORE INTO {table}_migrate_log VALUES (OLD.{key});
+            END;''')
+
+
+def replay_migrate_log(c, source, target, key, select):
+    # inside the swap transaction: recopy every row written since the copy started and any added after it
+    last = c.execute(f'''SELECT COALESCE(MAX({key}), 0) FROM {target};''').fetchone()[0]
+    c.execute(f'''DELETE FROM {target} WHERE {key} IN (SELECT rid FROM {source}_migrate_log);''')
+    c.execute(f'''INSERT INTO {target} SELECT {select} FROM {source}
+            WHERE {key} IN (SELECT rid FROM {source}_migrate_log) OR {key} > ?;''', (last,))
+    c.execute(f'''DROP TABLE {source}_migrate_log;''')
+
+
+def typed_columns(c, batch_size, progress):
+    ''' guests and quantity become INTEGER with constraints, and the columns the
+        browse page sorts and filters on get indexes. sqlite can't change a column
+        type in place so both tables are rebuilt; the copy is batched and resumable
+        and the old tables are only swapped out once both copies are complete.
+        other machines keep writing while it copies, triggers note which rows
+        they touched and those are copied again in the swap transaction.
+        values that aren't whole numbers stop the upgrade, see check_whole_numbers.
+        the lock is let go between batches, so another connection can start
+        the same migration meanwhile; they copy together and whichever gets
+        to the swap first does it, the other sees the _new tables gone and
+        leaves it there
+    '''
+    check_whole_numbers(c)
+    c.execute('''CREATE TABLE IF NOT EXISTS "booking_new" (
+            "booking_id"	INTEGER PRIMARY KEY,
+            "room" TEXT NOT NULL,
+            "guests" INTEGER NOT NULL CHECK (typeof("guests") = 'integer' AND "guests" >= 0),
+            "name"	TEXT NOT NULL,
+            "email"	TEXT NOT NULL
+            );''')
+    c.execute('''CREATE TABLE IF NOT EXISTS "items_new" (
+            "item_id"	INTEGER PRIMARY KEY,
+            "quantity" INTEGER NOT NULL CHECK (typeof("quantity") = 'integer' AND "quantity" >= 0),
+            "item"	TEXT NOT NULL
+            );''')
+    create_migrate_log(c, 'booking', 'booking_id')
+    create_migrate_log(c, 'items', 'item_id')
+    c.commit()
+    selects = {'booking': 'booking_id, room, CAST(trim(guests) AS INTEGER), name, email',
+               'items': 'item_id, CAST(trim(quantity) AS INTEGER), item'}
+    for table, key in (('booking', 'booking_id'), ('items', 'item_id')):
+        if not copy_in_batches(c, table, f'{table}_new', key, selects[table], batch_size, progress):
+            return
+
+    # swap the tables over in one go, nobody else can write until it commits
+    c.execute('''BEGIN IMMEDIATE;''')
+    if not table_exists(c, 'booking_new'):
+        return      # swapped by another connection since the last batch
+    check_whole_numbers(c)  # again, for anything written during the copy
+    for table, key in (('booking', 'booking_id'), ('items', 'item_id')):
+        replay_migrate_log(c, table, f'{table}_new', key, selects[table])
+        c.execute(f'''DROP TABLE {table};''')
+        c.execute(f'''ALTER TABLE {table}_new RENAME TO {table};''')
+        create_change_log_triggers(c, table, key)
+    for table, column in (('booking', 'room'), ('booking', 'guests'), ('booking', 'name'),
+                          ('booking', 'email'), ('items', 'item'), ('items', 'quantity')):
+        c.execute(f'''CREATE INDEX IF NOT EXISTS {table}_{column} ON {table}({column});''')
+
+
+def create_search_triggers(c, table, key, columns):
+    # an external content index stores no text of its own, the triggers feed it every change
+    fields = ', '.join(columns)
+    new = ', '.join(f'NEW.{column}' for column in columns)
+    old = ', '.join(f'OLD.{column}' for column in columns)
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS {table}_search_insert AFTER INSERT ON {table} BEGIN
+            INSERT INTO {table}_search(rowid, {fields}) VALUES (NEW.{key}, {new});
+            END;''')
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS {table}_search_delete AFTER DELETE ON {table} BEGIN
+            INSERT INTO {table}_search({table}_search, rowid, {fields}) VALUES ('delete', OLD.{key}, {old});
+            END;''')
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS {table}_search_update AFTER UPDATE OF {fields} ON {table} BEGIN
+            INSERT INTO {table}_search({table}_search, rowid, {fields}) VALUES ('delete', OLD.{key}, {old});
+            INSERT INTO {table}_search(rowid, {fields}) VALUES (NEW.{key}, {new});
+            END;''')
+
+
+# the text columns each table can be searched on
+SEARCH_COLUMNS = {'booking': ('booking_id', ('name', 'email')), 'items': ('item_id', ('item',))}
+
+
+def create_search_index(c, batch_size, progress):
+    ''' full text indexes over the booking names and emails and the item names.
+        prefix='2 3' keeps extra index entries for the first 2 and 3 letters of
+        every word so as-you-type prefix queries don't have to scan the term list
+    '''
+    for table, (key, columns) in SEARCH_COLUMNS.items():
+        c.execute(f'''CREATE VIRTUAL TABLE IF NOT EXISTS {table}_search USING fts5(
+                {', '.join(columns)}, content='{table}', content_rowid='{key}', prefix='2 3');''')
+        create_search_triggers(c, table, key, columns)
+        progress(f'  indexing {table}')
+        c.execute(f'''INSERT INTO {table}_search({table}_search) VALUES ('rebuild');''')
+
+
+def create_stock_totals(c, batch_size, progress):
+    ''' running inventory totals kept by triggers, so reports never scan items.
+        item_totals has one row per item name (the same item can be on several
+        records) and stock_total a single row for the whole inventory
+    '''
+    c.execute('''CREATE TABLE IF NOT EXISTS "item_totals" (
+            "item"	TEXT PRIMARY KEY,
+            "quantity"	INTEGER NOT NULL,
+            "records"	INTEGER NOT NULL
+            ) WITHOUT ROWID;''')
+    # the low stock report walks this
+    c.execute('''CREATE INDEX IF NOT EXISTS item_totals_quantity ON item_totals(quantity);''')
+    c.execute('''CREATE TABLE IF NOT EXISTS "stock_total" (
+            "id"	INTEGER PRIMARY KEY CHECK ("id" = 1),
+            "quantity"	INTEGER NOT NULL,
+            "records"	INTEGER NOT NULL
+            );''')
+    c.execute('''DELETE FROM item_totals;''')
+    c.execute('''INSERT INTO item_totals SELECT item, SUM(quantity), COUNT(*) FROM items GROUP BY item;''')
+    c.execute('''INSERT OR REPLACE INTO stock_total SELECT 1, COALESCE(SUM(quantity), 0), COUNT(*) FROM items;''')
+    create_stock_triggers(c)
+
+
+def create_stock_triggers(c):
+    add = '''INSERT INTO item_totals VALUES (NEW.item, NEW.quantity, 1) ON CONFLICT(item) DO UPDATE
+                SET quantity = quantity + excluded.quantity, records = records + 1;
+            UPDATE stock_total SET quantity = quantity + NEW.quantity, records = records + 1;'''
+    remove = '''UPDATE item_totals SET quantity = quantity - OLD.quantity, records = records - 1
+                WHERE item = OLD.item;
+            DELETE FROM item_totals WHERE item = OLD.item AND records = 0;
+            UPDATE stock_total SET quantity = quantity - OLD.quantity, records = records - 1;'''
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS items_stock_insert AFTER INSERT ON items BEGIN
+            {add}
+            END;''')
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS items_stock_delete AFTER DELETE ON items BEGIN
+            {remove}
+            END;''')
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS items_stock_update AFTER UPDATE OF item, quantity ON items BEGIN
+            {remove}
+            {add}
+            END;''')
+
+
+def add_row_versions(c, batch_size, progress):
+    # bumped by every save so an edit can tell whether someone else saved the row since it was read.
+    # adding a column with a default doesn't touch the existing rows, so this is instant
+    c.execute('''ALTER TABLE booking ADD COLUMN "version" INTEGER NOT NULL DEFAULT 0;''')
+    c.execute('''ALTER TABLE items ADD COLUMN "version" INTEGER NOT NULL DEFAULT 0;''')
+
+
+def add_stay_dates(c, batch_size, progress):
+    ''' check in / check out dates on bookings, as YYYY-MM-DD text so they
+        sort and compare as dates. both are empty for bookings without a stay.
+        booking_nights is an r*tree over the nights each stay covers (check
+        out day not included, so back to back stays don't overlap), so the
+        overlap queries only touch bookings near the dates asked about.
+        rooms keeps a count of bookings per room for the free rooms query
+    '''
+    c.execute('''ALTER TABLE booking ADD COLUMN "check_in" TEXT
+            CHECK ("check_in" IS NULL OR date("check_in") IS "check_in");''')
+    c.execute('''ALTER TABLE booking ADD COLUMN "check_out" TEXT
+            CHECK (("check_out" IS NULL) = ("check_in" IS NULL)
+                   AND ("check_out" IS NULL OR (date("check_out") IS "check_out" AND "check_out" > "check_in")));''')
+    c.execute('''CREATE VIRTUAL TABLE IF NOT EXISTS booking_nights USING rtree_i32(id, first_night, last_night);''')
+    c.execute('''CREATE TABLE IF NOT EXISTS "rooms" (
+            "room"	TEXT PRIMARY KEY,
+            "bookings"	INTEGER NOT NULL
+            ) WITHOUT ROWID;''')
+    c.execute('''DELETE FROM rooms;''')
+    c.execute('''INSERT INTO rooms SELECT room, COUNT(*) FROM booking GROUP BY room;''')
+    create_stay_triggers(c)
+
+
+def create_stay_triggers(c):
+    # nights are julian day numbers, the stay covers check_in up to the night before check_out
+    add_nights = '''INSERT INTO booking_nights SELECT NEW.booking_id, CAST(julianday(NEW.check_in) AS INTEGER),
+                CAST(julianday(NEW.check_out) AS INTEGER) - 1 WHERE NEW.check_in IS NOT NULL;'''
+    add_room = '''INSERT INTO rooms VALUES (NEW.room, 1) ON CONFLICT(room) DO UPDATE SET bookings = bookings + 1;'''
+    remove_room = '''UPDATE rooms SET bookings = bookings - 1 WHERE room = OLD.room;
+            DELETE FROM rooms WHERE room = OLD.room AND bookings = 0;'''
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS booking_stay_insert AFTER INSERT ON booking BEGIN
+            {add_nights}
+            {add_room}
+            END;''')
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS booking_stay_delete AFTER DELETE ON booking BEGIN
+            DELETE FROM booking_nights WHERE id = OLD.booking_id;
+            {remove_room}
+            END;''')
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS booking_stay_update AFTER UPDATE OF check_in, check_out ON booking BEGIN
+            DELETE FROM booking_nights WHERE id = OLD.booking_id;
+            {add_nights}
+            END;''')
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS booking_room_update AFTER UPDATE OF room ON booking BEGIN
+            {remove_room}
+            {add_room}
+            END;''')
+
+
+# the columns the entry fields offer to complete, see SQLStorage.suggest
+SUGGEST_COLUMNS = {'booking': ('name', 'email'), 'items': ('item',)}
+
+
+def create_suggest_indexes(c, batch_size, progress):
+    # case blind copies of the name, email and item indexes, so typing "ali" finds "Alice"
+    for table, columns in SUGGEST_COLUMNS.items():
+        for column in columns:
+            c.execute(f'''CREATE INDEX IF NOT EXISTS {table}_{column}_nocase ON {table}({column} COLLATE NOCASE);''')
+
+
+# every schema change goes on the end of this list, never edit one that has shipped.
+# PRAGMA user_version holds how many of them the db has had
+MIGRATIONS = [
+    ('create the booking and items tables', create_tables),
+    ('add the change log', create_change_log),
+    ('make guests and quantity integers and index the sortable columns', typed_columns),
+    ('add full text search over names, emails and items', create_search_index),
+    ('add running inventory totals', create_stock_totals),
+    ('add a version to every row for conflict checks', add_row_versions),
+    ('add check in and check out dates with an index of booked nights', add_stay_dates),
+    ('index names, emails and items without case for autocomplete', create_suggest_indexes),
+]
+
+
+def migrate(c, batch_size=BATCH_SIZE, progress=None):
+    ''' upgrade a db connection to the latest schema in place.
+        each migration runs inside a write transaction that also bumps
+        user_version, so a migration is either fully applied or not at all;
+        the long ones commit as they go but can be resumed
+    '''
+    progress = progress or (lambda message: None)
+    c.commit()
+    # an up to date db is the usual case, don't queue behind the writers for a lock it doesn't need
+    version = c.execute('''PRAGMA user_version;''').fetchone()[0]
+    if version >= len(MIGRATIONS):
+        return version
+    while True:
+        c.execute('''BEGIN IMMEDIATE;''')
+        # read it inside the transaction in case another process just migrated
+        version = c.execute('''PRAGMA user_version;''').fetchone()[0]
+        if version >= len(MIGRATIONS):
+            c.commit()
+            return version
+        description, step = MIGRATIONS[version]
+        progress(f'migration {version + 1}: {description}')
+        try:
+            step(c, batch_size, progress)
+        except BaseException:
+            # what the step committed as it went stays, it picks up from there next time
+            if c.in_transaction:
+                c.rollback()
+            raise
+        if not c.in_transaction:
+            c.execute('''BEGIN IMMEDIATE;''')
+        # a step that committed as it went may have been finished by another connection, maybe more after it
+        if c.execute('''PRAGMA user_version;''').fetchone()[0] == version:
+            c.execute(f'''PRAGMA user_version = {version + 1};''')
+        c.commit()
+
 
 def close_database():
     conn.commit()
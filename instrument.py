@@ -0,0 +1,120 @@
+''' opt-in timing and counters for a storage object
+
+    instrument(storage) wraps every public method of a SQLStorage so each
+    call records its count, latency histogram and rows returned, and hooks
+    sqlite's trace callback to count commits and remember the sql each call
+    ran. calls slower than slow_ms are kept (and printed) with their sql.
+    read the numbers with storage.stats.snapshot() or dump them as json.
+'''
+import json
+import sys
+import time
+from collections import deque
+
+from models import Record
+
+# upper edges of the latency histogram buckets in ms, the last bucket is everything above
+BUCKETS_MS = (0.1, 0.5, 1, 5, 10, 50, 100, 500, 1000)
+
+
+class StorageStats():
+    ''' the numbers collected for one storage object
+    '''
+    def __init__(self, slow_ms=100, keep_slow=50):
+        self.slow_ms = slow_ms
+        self.methods = {}   # method name -> counters
+        self.commits = 0
+        self.statements = 0
+        self.slow = deque(maxlen=keep_slow)     # most recent slow calls
+        self.current_sql = []   # statements run by the call in progress
+        self.depth = 0          # methods call each other, only the outermost one owns the sql
+        self.started = time.time()
+
+    def trace(self, sql):
+        # sqlite calls this for every statement the connection runs
+        self.statements += 1
+        if sql.startswith('COMMIT'):
+            self.commits += 1
+        # triggers make sqlite report the statement that fired them again, keep it once
+        if self.depth and (not self.current_sql or self.current_sql[-1] != sql):
+            self.current_sql.append(sql)
+
+    def record(self, name, ms, rows, args):
+        counters = self.methods.get(name)
+        if counters is None:
+            counters = self.methods[name] = {'calls': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'rows': 0,
+                                             'histogram': [0] * (len(BUCKETS_MS) + 1)}
+        counters['calls'] += 1
+        counters['total_ms'] += ms
+        counters['max_ms'] = max(counters['max_ms'], ms)
+        counters['rows'] += rows
+        bucket = 0
+        while bucket < len(BUCKETS_MS) and ms > BUCKETS_MS[bucket]:
+            bucket += 1
+        counters['histogram'][bucket] += 1
+        if self.slow_ms is not None and ms >= self.slow_ms and self.depth == 1:
+            entry = {'method': name, 'ms': round(ms, 3), 'args': repr(args)[:200],
+                     'sql': [' '.join(sql.split()) for sql in self.current_sql],
+                     'at': time.strftime('%H:%M:%S')}
+            self.slow.append(entry)
+            print(f"slow storage call {name} took {ms:.1f} ms: {'; '.join(entry['sql'])}", file=sys.stderr)
+
+    def snapshot(self):
+        ''' a plain dict copy of everything, safe to hand to another thread
+        '''
+        methods = {}
+        for name, counters in self.methods.items():
+            methods[name] = dict(counters, histogram=list(counters['histogram']),
+                                 mean_ms=counters['total_ms'] / counters['calls'])
+        return {'uptime_s': time.time() - self.started, 'commits': self.commits,
+                'statements': self.statements, 'buckets_ms': list(BUCKETS_MS),
+                'methods': methods, 'slow': list(self.slow)}
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), indent=2)
+
+    def dump(self, path):
+        with open(path, 'w') as f:
+            f.write(self.to_json())
+
+
+def count_rows(result):
+    if isinstance(result, list):
+        return len(result)
+    if isinstance(result, Record):
+        return 1
+    return 0
+
+
+def wrap(stats, name, method):
+    def timed(*args, **kwargs):
+        stats.depth += 1
+        if stats.depth == 1:
+            stats.current_sql = []
+        result = None
+        start = time.perf_counter()
+        try:
+            result = method(*args, **kwargs)
+        finally:
+            ms = (time.perf_counter() - start) * 1000
+            stats.record(name, ms, count_rows(result), args)
+            stats.depth -= 1
+        return result
+    timed.__name__ = name
+    timed.__doc__ = method.__doc__
+    return timed
+
+
+def instrument(storage, slow_ms=100):
+    ''' turn on instrumentation for a SQLStorage, returns the same object
+        with a .stats attribute. slow_ms=None switches slow call logging off
+    '''
+    stats = StorageStats(slow_ms)
+    storage.conn.set_trace_callback(stats.trace)
+    for name in dir(type(storage)):
+        if name.startswith('_') or not callable(getattr(type(storage), name)):
+            continue
+        # the bound method is replaced on the instance, the class is left alone
+        setattr(storage, name, wrap(stats, name, getattr(storage, name)))
+    storage.stats = stats
+    return storage
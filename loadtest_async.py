@@ -0,0 +1,81 @@
+''' load test for AsyncSQLStorage
+
+    runs a number of concurrent reader and writer tasks against the database
+    for a while and reports throughput and latency for each. writers add
+    bookings and delete them again, so the table is left how it was found.
+
+    usage: python loadtest_async.py [--db sql_data.db] [--readers 8] [--writers 2] [--seconds 10]
+'''
+import argparse
+import asyncio
+import random
+import statistics
+import time
+
+from async_storage import AsyncSQLStorage
+from models import Booking
+
+
+def summary(label, latencies, seconds):
+    if not latencies:
+        return f'{label:<8} no operations'
+    latencies.sort()
+    p95 = latencies[int(len(latencies) * 0.95) - 1] if len(latencies) >= 20 else latencies[-1]
+    return (f'{label:<8}{len(latencies):>8} ops {len(latencies) / seconds:>10.1f} ops/s '
+            f'p50 {statistics.median(latencies) * 1000:>7.2f} ms  p95 {p95 * 1000:>7.2f} ms')
+
+
+async def reader(storage, rids, deadline, latencies):
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        await storage.get_record_booking(random.choice(rids))
+        latencies.append(time.perf_counter() - start)
+
+
+async def writer(storage, deadline, latencies):
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        booking = Booking(room='999', guests='1', name='load test', email='loadtest@example.com')
+        await storage.save_record_booking(booking)
+        await storage.delete_record_booking(booking.rid)
+        latencies.append(time.perf_counter() - start)
+
+
+async def main(args):
+    storage = await AsyncSQLStorage.open(args.db, readers=args.pool)
+    # a sample of ids to read, no need to pull a big table into memory
+    rids = [record.rid for record in await storage.read('get_page_booking', 10000)]
+    if not rids:
+        # something to read, removed again at the end
+        seed = [Booking(room=str(i), guests='1', name='load test', email='loadtest@example.com')
+                for i in range(100)]
+        for booking in seed:
+            await storage.save_record_booking(booking)
+        rids = [booking.rid for booking in seed]
+    else:
+        seed = []
+
+    reads, writes = [], []
+    deadline = time.perf_counter() + args.seconds
+    start = time.perf_counter()
+    await asyncio.gather(*[reader(storage, rids, deadline, reads) for _ in range(args.readers)],
+                         *[writer(storage, deadline, writes) for _ in range(args.writers)])
+    seconds = time.perf_counter() - start
+
+    for booking in seed:
+        await storage.delete_record_booking(booking.rid)
+    await storage.close()
+
+    print(f'{args.readers} readers / {args.writers} writers / pool of {args.pool} for {seconds:.1f} s')
+    print(summary('reads', reads, seconds))
+    print(summary('writes', writes, seconds))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', default='sql_data.db')
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--writers', type=int, default=2)
+    parser.add_argument('--pool', type=int, default=AsyncSQLStorage.READERS)
+    parser.add_argument('--seconds', type=float, default=10)
+    asyncio.run(main(parser.parse_args()))
@@ -1,18 +1,33 @@
+import time
+STARTED = time.perf_counter()   # the startup timing report counts from here
 import tkinter as tk
 from tkinter import font as tkfont
+from tkinter import messagebox
+from tkinter import simpledialog
 import tkinter.ttk as ttk  # just for treeview
 import entry_field  # no particular good reason I did it the other way here
+import virtual_tree
+import db_worker
+import instrument
+import backup
+import browse_snapshot
 from models import *  # done this way to access classes just by name
 import sys  # only used for flushing debug print statements
+import os
+import json
 
 
 class App(tk.Tk):
+    BACKUP_POLL_MS = 500    # how often the status line checks on a running backup
 
     def __init__(self, *args, **kwargs):
         tk.Tk.__init__(self, *args, **kwargs)
         # this is the main database access object
-        # note you must run the init_db.py script before using SQLStorage
-        self.data = SQLStorage()
+        # SQLStorage creates or upgrades the tables itself, see init_db.migrate
+        # the storage lives on a worker thread, pages send it requests through self.data
+        self.data = db_worker.DatabaseExecutor(self, self.make_storage, on_busy=self.show_busy,
+                                               on_error=self.show_error)
+        self.protocol("WM_DELETE_WINDOW", self.close)
 
         # set a single font to be used throughout the app
         self.title_font = tkfont.Font(
@@ -22,29 +37,45 @@ class App(tk.Tk):
         # on top of each other, then the one we want visible
         # will be raised above the others
         container = tk.Frame(self)
+        # status line along the bottom for busy / error messages
+        self.status = tk.Label(self, text="", anchor=tk.W)
+        self.status.pack(side="bottom", fill="x")
         container.pack(side="top", fill="both", expand=True)
         container.grid_rowconfigure(0, weight=1)
         container.grid_columnconfigure(0, weight=1)
 
+        self.container = container
+        # all off the frames, each one is only built the first time it is shown
+        self.pages = {F.__name__: F for F in (BrowsePage, ReadPageBooking, ReadPageInventory,
+                                              CreatePageBooking, CreatePageInventory)}
         self.frames = {}
-        # all off the frames
-        for F in (BrowsePage, ReadPageBooking, ReadPageInventory, CreatePageBooking, CreatePageInventory):
-            page_name = F.__name__
+
+        # startup timing: phase -> seconds since the process started, see startup_report
+        self.startup = {'imports': time.perf_counter() - STARTED}
+        # program starts off with the browse page
+        self.show_frame("BrowsePage")
+        self.mark_startup('browse page built')
+        self.after_idle(self.first_paint)
+
+        # scheduled snapshots of the db, off unless STORAGE_BACKUP_DIR is set
+        self.backups = self.start_backups()
+        self.backup_status = None
+
+    def get_frame(self, page_name):
+        frame = self.frames.get(page_name)
+        if frame is None:
             # last arg - send the object that accesses the db
-            frame = F(parent=container, controller=self, persist=self.data)
+            frame = self.pages[page_name](parent=self.container, controller=self, persist=self.data)
             self.frames[page_name] = frame
-
             # put all of the pages in the same location;
             # the one on the top of the stacking order
             # will be the one that is visible.
             frame.grid(row=0, column=0, sticky="nsew")
-
-        # program starts off with the browse page
-        self.show_frame("BrowsePage")
+        return frame
 
     def show_frame(self, page_name, rid=0):
         '''Show a frame for the given page name'''
-        frame = self.frames[page_name]
+        frame = self.get_frame(page_name)
         # the edit screen requires knowledge of the id of the item
         if not rid == 0:
             frame.update(rid)
@@ -53,62 +84,188 @@ class App(tk.Tk):
         # bring it to the front of the stacking order
         frame.tkraise()
 
+    def make_storage(self):
+        ''' runs on the db worker thread. set STORAGE_STATS=1 to time every storage
+            call, and STORAGE_SLOW_MS for what counts as a slow one.
+            STORAGE_BUSY_TIMEOUT is how many seconds a save waits for another machine's to finish.
+            STORAGE_WRITE_BEHIND=1 groups back to back saves into one commit, handy for check-in rushes.
+            the browse page's first rows are saved on the way out for the next start
+        '''
+        storage = SQLStorage(timeout=float(os.environ.get('STORAGE_BUSY_TIMEOUT', SQLStorage.BUSY_TIMEOUT)),
+                             write_behind=bool(os.environ.get('STORAGE_WRITE_BEHIND')), browse_snapshot=True)
+        if os.environ.get('STORAGE_STATS'):
+            instrument.instrument(storage, slow_ms=float(os.environ.get('STORAGE_SLOW_MS', 100)))
+        return storage
+
+    def start_backups(self):
+        ''' STORAGE_BACKUP_DIR=<folder> snapshots the db into that folder every
+            STORAGE_BACKUP_MINUTES (60) and keeps the newest STORAGE_BACKUP_KEEP (24).
+            they run on their own thread and connection, the app carries on as normal
+        '''
+        folder = os.environ.get('STORAGE_BACKUP_DIR')
+        if not folder:
+            return None
+        scheduler = backup.BackupScheduler(SQLStorage.FILENAME, folder,
+                                           interval=float(os.environ.get('STORAGE_BACKUP_MINUTES', 60)) * 60,
+                                           keep=int(os.environ.get('STORAGE_BACKUP_KEEP', backup.KEEP)))
+        self.after(self.BACKUP_POLL_MS, self.poll_backup)
+        return scheduler
+
+    def poll_backup(self):
+        # the scheduler swaps in a new status dict on every step, so a changed one means news
+        status = self.backups.status
+        if status is not self.backup_status:
+            self.backup_status = status
+            if status['state'] == 'failed':
+                self.show_error(f"backup failed: {status['error']}")
+            elif self.status.cget("fg") != "red":
+                if status['state'] == 'running':
+                    percent = status['pages'] * 100 // max(status['total_pages'], 1)
+                    self.status.config(text=f"Backing up: {percent}% ({status['mb_per_sec']:.1f} MB/s)",
+                                       fg="black")
+                elif status['state'] == 'done':
+                    self.status.config(text=f"Backup saved to {status['target']} at {status['at']} "
+                                            f"({status['bytes'] / 1e6:.1f} MB, {status['mb_per_sec']:.1f} MB/s)",
+                                       fg="black")
+        self.after(self.BACKUP_POLL_MS, self.poll_backup)
+
+    def mark_startup(self, phase):
+        self.startup[phase] = time.perf_counter() - STARTED
+
+    def first_paint(self):
+        # the window has been laid out and drawn, though the rows may still be loading
+        self.update_idletasks()
+        self.mark_startup('first paint')
+
+    def data_loaded(self, counts):
+        ''' BrowsePage calls this once its first rows are in the treeviews,
+            with the row counts so the report shows how big the db was
+        '''
+        self.update_idletasks()
+        self.mark_startup('rows painted')
+        self.startup['bookings'], self.startup['inventory'] = counts
+        self.startup_report()
+
+    def startup_report(self):
+        ''' STARTUP_TIMING=1 prints how long each startup phase took,
+            STARTUP_TIMING=<file> appends it to that file as a json line
+        '''
+        target = os.environ.get('STARTUP_TIMING')
+        if not target:
+            return
+        if target == '1':
+            phases = ', '.join(f"{phase} {seconds * 1000:.0f} ms" for phase, seconds in self.startup.items()
+                               if isinstance(seconds, float))
+            print(f"startup: {phases} ({self.startup['bookings']} bookings, "
+                  f"{self.startup['inventory']} inventory)", file=sys.stderr)
+        else:
+            with open(target, 'a') as f:
+                f.write(json.dumps(dict(self.startup, time=time.strftime('%Y-%m-%dT%H:%M:%S'))) + '\n')
+
+    def show_busy(self, busy):
+        ''' called by the db worker when it starts and runs out of work
+        '''
+        if busy:
+            self.status.config(text="Working...", fg="black")
+            self.config(cursor="watch")
+        else:
+            if self.status.cget("fg") != "red":     # errors stay up until the next request starts
+                self.status.config(text="")
+            self.config(cursor="")
+
+    def show_error(self, error):
+        self.status.config(text=f"Error: {error}", fg="red")
+
+    def close(self):
+        # let the worker finish any queued writes and close the db before the window goes
+        if self.backups is not None:
+            self.backups.stop(wait=False)   # an unfinished snapshot is only a .part file, backup.prune clears it
+        self.data.shutdown()
+        self.destroy()
+
 
 class BrowsePage(tk.Frame):
     ''' the Browse page must show all the items in the database and allow
     access to editing and deleting, as well as the ability to go to a screen
     to add new ones. This is the 'home' screen.
     '''
+    SEARCH_DELAY_MS = 250   # how long typing has to pause before the search runs
+    CHANGE_POLL_MS = 1000   # how often to check whether another machine changed the db
+    # treeview column -> db column for the headings that sort and filter, in the same
+    # order as the row values so the db column's value can be found in a row
+    SORT_COLUMNS = {
+        'booking': {'booking_id': 'booking_id', 'room #': 'room', 'guests #': 'guests',
+                    'name': 'name', 'email': 'email'},
+        'inventory': {'item_id': 'item_id', 'quantity': 'quantity', 'item': 'item'},
+    }
+    DEFAULT_ORDER = {'booking': ('booking_id', True), 'inventory': ('item_id', True)}  # newest first
+
     def __init__(self, parent, controller, persist=None):
         tk.Frame.__init__(self, parent)
         self.controller = controller
 
+        # search box across the top, both treeviews only show matching rows while it has text
+        search_bar = tk.Frame(self)
+        search_bar.grid(row=0, column=0, columnspan=3, pady=5)
+        self.search = entry_field.EntryField(search_bar, label="Search")
+        self.search.grid(row=0, column=0)
+        self.search.dataentry.trace_add("write", self.on_search_typed)
+        clear_button = tk.Button(search_bar, text="Clear", command=self.search.reset)
+        clear_button.grid(row=0, column=1)
+        self.search_job = None      # pending after() call for the debounced search
+        self.search_text = ""       # what the treeviews are filtered on right now
+        # clicking a heading sorts by it, right clicking it sets a filter on it
+        self.order = dict(self.DEFAULT_ORDER)           # kind -> (db column, descending)
+        self.filters = {'booking': {}, 'inventory': {}}     # kind -> {db column: value}
+
         # labels to clarify which treeview is which
         label = tk.Label(self, text="Hotel Booking",
                          font=controller.title_font)
-        label.grid(row=0,column=0)
+        label.grid(row=1,column=0)
 
         label = tk.Label(self, text="Hotel Inventory",
                          font=controller.title_font)
-        label.grid(row=0,column=1)
+        label.grid(row=1,column=1)
+
+        label = tk.Label(self, text="Stock Report",
+                         font=controller.title_font)
+        label.grid(row=1,column=2)
+
+        # this object is the data persistence model
+        self.persist = persist
 
-        ''' '''
         # set up the treeview for hotel booking
-        booking_table = tk.Frame(self, width=100)
-        booking_table.grid(row=1,column=0)
-        scrollbarx = tk.Scrollbar(booking_table, orient=tk.HORIZONTAL) # scrollbars if necessary
-        scrollbary = tk.Scrollbar(booking_table, orient=tk.VERTICAL)
-        self.tree = ttk.Treeview(booking_table, columns=("booking_id", "room #", "guests #", "name", "email"),
-                                 selectmode="extended", yscrollcommand=scrollbary.set, xscrollcommand=scrollbarx.set)
-        scrollbary.config(command=self.tree.yview)
-        scrollbary.pack(side=tk.RIGHT, fill=tk.Y)
-        scrollbarx.config(command=self.tree.xview)
-        scrollbarx.pack(side=tk.BOTTOM, fill=tk.X)
+        # the virtual treeview only ever loads the rows around the scroll window
+        count, fetch, fetch_ids = self.table_source('booking')
+        self.booking_view = virtual_tree.VirtualTreeview(self, columns=("booking_id", "room #", "guests #", "name", "email",
+                                                                  "check_in", "check_out"),
+                                                         executor=self.persist, count=count, fetch=fetch,
+                                                         fetch_ids=fetch_ids, width=100)
+        self.booking_view.grid(row=2,column=0)
+        self.tree = self.booking_view.tree
         # this section would allow for expanding the viewable columns
         self.tree.heading('booking_id', text="Booking ID", anchor=tk.W)
         self.tree.heading('room #', text="Room #", anchor=tk.W)
         self.tree.heading('guests #', text="# of guests", anchor=tk.W)
         self.tree.heading('name', text="Name", anchor=tk.W)
         self.tree.heading('email', text="Email", anchor=tk.W)
+        self.tree.heading('check_in', text="Check in", anchor=tk.W)
+        self.tree.heading('check_out', text="Check out", anchor=tk.W)
         self.tree.column('#0', stretch=tk.NO, minwidth=0, width=0)
         self.tree.column('#1', stretch=tk.NO, minwidth=0, width=70)
         self.tree.column('#2', stretch=tk.NO, minwidth=0, width=70)
-        self.tree.column('#3', stretch=tk.NO, minwidth=0, width=200)
-        self.tree.column('#4', stretch=tk.NO, minwidth=0, width=200)
-        self.tree.bind('<<TreeviewSelect>>', self.on_select)
-        self.tree.pack()
-        self.selected = []
-        
-        Inventory_table = tk.Frame(self, width=100)
-        Inventory_table.grid(row=1,column=1)
-        scrollbarx = tk.Scrollbar(Inventory_table, orient=tk.HORIZONTAL) # scrollbar if necessary
-        scrollbary = tk.Scrollbar(Inventory_table, orient=tk.VERTICAL)
-        self.treeInventory = ttk.Treeview(Inventory_table, columns=("item_id","quantity", "item"),
-                                 selectmode="extended", yscrollcommand=scrollbary.set, xscrollcommand=scrollbarx.set)
-        scrollbary.config(command=self.treeInventory.yview)
-        scrollbary.pack(side=tk.RIGHT, fill=tk.Y)
-        scrollbarx.config(command=self.treeInventory.xview)
-        scrollbarx.pack(side=tk.BOTTOM, fill=tk.X)
+        self.tree.column('#3', stretch=tk.NO, minwidth=0, width=70)
+        self.tree.column('#4', stretch=tk.NO, minwidth=0, width=160)
+        self.tree.column('#5', stretch=tk.NO, minwidth=0, width=200)
+        self.tree.column('#6', stretch=tk.NO, minwidth=0, width=90)
+        self.tree.column('#7', stretch=tk.NO, minwidth=0, width=90)
+
+        count, fetch, fetch_ids = self.table_source('inventory')
+        self.inventory_view = virtual_tree.VirtualTreeview(self, columns=("item_id","quantity", "item"),
+                                                           executor=self.persist, count=count, fetch=fetch,
+                                                           fetch_ids=fetch_ids, width=100)
+        self.inventory_view.grid(row=2,column=1)
+        self.treeInventory = self.inventory_view.tree
         # this section would allow for expanding the viewable columns
         self.treeInventory.heading('item_id', text=" Item ID", anchor=tk.W)
         self.treeInventory.heading('quantity', text=" Quantity", anchor=tk.W)
@@ -116,24 +273,25 @@ class BrowsePage(tk.Frame):
         self.treeInventory.column('#0', stretch=tk.NO, minwidth=0, width=0)
         self.treeInventory.column('#1', stretch=tk.NO, minwidth=0, width=100)
         self.treeInventory.column('#2', stretch=tk.NO, minwidth=0, width=100)
-        self.treeInventory.bind('<<TreeviewSelect>>', self.on_select)
-        self.treeInventory.pack()
-        self.selected = []
-        
-        # this object is the data persistence model
-        self.persist = persist
-        all_records_booking = self.persist.get_all_sorted_records_booking()
-        # grab all records from booking db and add them to the treeview widget
-        for record in all_records_booking:
-            self.tree.insert("", 0, values=(
-                record.rid, record.room, record.guests, record.name, record.email))
 
-
-        all_records_inventory = self.persist.get_all_sorted_records_inventory()
-        # grab all records from inventory db and add them to the treeview widget
-        for record in all_records_inventory:
-            self.treeInventory.insert("", 0, values=(
-                record.rid, record.item, record.quantity))
+        self.views = {'booking': self.booking_view, 'inventory': self.inventory_view}
+        self.titles = {}    # kind -> {treeview column: heading text without the sort and filter marks}
+        for kind, view in self.views.items():
+            self.titles[kind] = {column: view.tree.heading(column, 'text') for column in self.SORT_COLUMNS[kind]}
+            for column in self.SORT_COLUMNS[kind]:
+                view.tree.heading(column, command=lambda kind=kind, column=column: self.sort_by(kind, column))
+            view.tree.bind('<Button-3>', lambda event, kind=kind: self.ask_filter(kind, event))
+            self.show_headings(kind)
+
+        # inventory totals next to the inventory treeview
+        self.stock_report = StockReport(self, self.persist)
+        self.stock_report.grid(row=2, column=2, sticky="n")
+
+        # nothing is loaded until the page is first shown, see update()
+        self.version = None
+        self.loaded = False
+        # until then the rows saved when the app last closed stand in, see load()
+        self.snapshot_version = self.preload_snapshot()
 
         # all buttons for editing, deleting, creating records for booking and inventory
         # all listed vertically together
@@ -149,78 +307,524 @@ class BrowsePage(tk.Frame):
                                command=lambda: controller.show_frame("CreatePageBooking"))
         new_button_booking.grid(column=0)
 
+        # every row matching the search or the filters, not just the ones on screen
+        select_all_booking = tk.Button(self, text="Select All", command=self.booking_view.select_all)
+        select_all_booking.grid(column=0)
+
         
         edit_button_inventory = tk.Button(self, text="Edit Record",
                                 command=self.edit_selected_inventory)
-        edit_button_inventory.grid(row=2,column=1)
+        edit_button_inventory.grid(row=3,column=1)
 
         delete_button_inventory = tk.Button(self, text="Delete Record(s)",
                                   command=self.delete_selected_inventory)
-        delete_button_inventory.grid(row=3,column=1)
+        delete_button_inventory.grid(row=4,column=1)
 
         new_button_inventory = tk.Button(self, text="Add New Record",
                                command=lambda: controller.show_frame("CreatePageInventory"))
-        new_button_inventory.grid(row=4,column=1)
+        new_button_inventory.grid(row=5,column=1)
+
+        select_all_inventory = tk.Button(self, text="Select All", command=self.inventory_view.select_all)
+        select_all_inventory.grid(row=6,column=1)
+
+        # debug window with the live storage numbers
+        stats_button = tk.Button(self, text="Storage Stats",
+                                 command=lambda: StatsPanel(self, self.persist))
+        stats_button.grid(row=7, column=0, columnspan=3, pady=5)
 
     def edit_selected_booking(self):
-        # editing booking records
-        idx = self.selected[0]  # use first selected item if multiple
-        record_id = self.tree.item(idx)['values'][0]
-        self.controller.show_frame("ReadPageBooking", record_id) # switch to editing screen
+        # editing booking records, several at once get the bulk edit form.
+        # the view keeps the selected ids, including rows scrolled out of sight
+        record_ids = sorted(self.booking_view.selected)
+        if len(record_ids) > 1:
+            BulkEditDialog(self, self.controller, self.persist, 'booking', record_ids, on_saved=self.update)
+        elif record_ids:
+            self.controller.show_frame("ReadPageBooking", record_ids[0]) # switch to editing screen
     
     def edit_selected_inventory(self):
-        # editing inventory records
-        idx = self.selected[0]  # use first selected item if multiple
-        record_id = self.treeInventory.item(idx)['values'][0]
-        self.controller.show_frame("ReadPageInventory", record_id) # switch to editing screen
-
-    def on_select(self, event):
-        ''' add the currently highlighted items to a list
-        '''
-        self.selected = event.widget.selection()
+        # editing inventory records, several at once get the bulk edit form
+        record_ids = sorted(self.inventory_view.selected)
+        if len(record_ids) > 1:
+            BulkEditDialog(self, self.controller, self.persist, 'inventory', record_ids, on_saved=self.update)
+        elif record_ids:
+            self.controller.show_frame("ReadPageInventory", record_ids[0]) # switch to editing screen
+
+    def confirm_delete(self, record_ids, what):
+        # most of a big selection is off screen, so say how many rows are about to go
+        return len(record_ids) < 2 or messagebox.askyesno("Delete records", f"Delete {len(record_ids)} {what}?",
+                                                          default=messagebox.NO, parent=self)
 
     def delete_selected_booking(self):
-        ''' uses the selected list to remove and delete certain records
+        ''' uses the selected ids to remove and delete certain records
             booking records
         '''
-        for idx in self.selected:
-            record_id = self.tree.item(idx)['values'][0]
-            # remove from the db
-            self.persist.delete_record_booking(record_id)
-            # remove from the treeview
-            self.tree.delete(idx)
+        record_ids = sorted(self.booking_view.selected)
+        if not self.confirm_delete(record_ids, "bookings"):
+            return
+        # remove from the db, all in one commit, then pull the deletes back through the change feed
+        self.persist.submit('delete_records_booking', record_ids, callback=lambda result: self.update())
     
     def delete_selected_inventory(self):
-        ''' uses the selected list to remove and delete certain records
+        ''' uses the selected ids to remove and delete certain records
             inventory records
         '''
-        for idx in self.selected:
-            record_id = self.treeInventory.item(idx)['values'][0]
-            # remove from the db
-            self.persist.delete_record_inventory(record_id)
-            # remove from the treeview
-            self.treeInventory.delete(idx)
+        record_ids = sorted(self.inventory_view.selected)
+        if not self.confirm_delete(record_ids, "inventory records"):
+            return
+        # remove from the db, all in one commit, then pull the deletes back through the change feed
+        self.persist.submit('delete_records_inventory', record_ids, callback=lambda result: self.update())
+
+    # the fetch functions run on the db worker thread and get the storage handed to them
+    def table_source(self, kind):
+        ''' count, fetch and fetch_ids functions for one treeview showing every row
+            of kind matching its column filters, in its heading's order. sorting
+            and filtering both happen in the db on indexed columns, so only the
+            rows on screen are ever read
+        '''
+        order_by, descending = self.order[kind]
+        filters = dict(self.filters[kind])
+        position = list(self.SORT_COLUMNS[kind].values()).index(order_by)
+        values = booking_values if kind == 'booking' else inventory_values
+
+        def count(storage):
+            return getattr(storage, f'count_records_{kind}')(filters)
+
+        def fetch(storage, offset, limit, after=None):
+            # scrolling down seeks past the last row we already have instead of using an offset
+            get_page = getattr(storage, f'get_page_{kind}')
+            if after is not None:
+                records = get_page(limit, after_rid=after[0], after_value=after[position], order_by=order_by,
+                                   descending=descending, filters=filters)
+            else:
+                records = get_page(limit, order_by=order_by, descending=descending, filters=filters, offset=offset)
+            return [values(record) for record in records]
+
+        # an edit can move a row or drop it out of a filter, only the default order is safe to patch in place
+        if (order_by, descending) == self.DEFAULT_ORDER[kind] and not filters:
+            return count, fetch, getattr(self, f'fetch_{kind}_ids')
+        return count, fetch, None
+
+    def fetch_booking_ids(self, storage, rids):
+        return [booking_values(record) for record in storage.get_records_by_ids_booking(rids)]
+
+    def fetch_inventory_ids(self, storage, rids):
+        return [inventory_values(record) for record in storage.get_records_by_ids_inventory(rids)]
+
+    def search_fetch_booking(self, text):
+        # a fetch function for the booking treeview that only returns records matching text
+        def fetch(storage, offset, limit, after=None):
+            if after is not None:
+                records = storage.search_booking(text, limit, after_rid=after[0])
+            else:
+                records = storage.search_booking(text, limit, offset)
+            return [booking_values(record) for record in records]
+        return fetch
+
+    def search_fetch_inventory(self, text):
+        # a fetch function for the inventory treeview that only returns records matching text
+        def fetch(storage, offset, limit, after=None):
+            if after is not None:
+                records = storage.search_inventory(text, limit, after_rid=after[0])
+            else:
+                records = storage.search_inventory(text, limit, offset)
+            return [inventory_values(record) for record in records]
+        return fetch
+
+    def sort_by(self, kind, column):
+        # heading click: sort by that column, clicking the same heading again flips the direction.
+        # search results always come newest match first, so the headings do nothing during a search
+        if self.search_text:
+            return
+        order_by = self.SORT_COLUMNS[kind][column]
+        current, descending = self.order[kind]
+        self.order[kind] = (order_by, not descending if order_by == current else False)
+        self.apply_source(kind)
+
+    def ask_filter(self, kind, event):
+        ''' right click on a heading: ask for the value that column has to match,
+            a blank answer removes the filter
+        '''
+        tree = self.views[kind].tree
+        if self.search_text or tree.identify_region(event.x, event.y) != 'heading':
+            return
+        column = tree.column(tree.identify_column(event.x), 'id')
+        if column not in self.SORT_COLUMNS[kind]:
+            return
+        order_by = self.SORT_COLUMNS[kind][column]
+        number = order_by in SQLStorage.NUMBER_COLUMNS
+        value = simpledialog.askstring("Filter", f"Only show rows where {self.titles[kind][column].strip()} "
+                                       + ("is" if number else "starts with") + "\n(leave blank to show all)",
+                                       initialvalue=self.filters[kind].get(order_by, ""), parent=self)
+        if value is None:
+            return
+        value = value.strip()
+        if not value:
+            self.filters[kind].pop(order_by, None)
+        elif number and not value.isdigit():
+            messagebox.showerror("Filter", f"{self.titles[kind][column].strip()} has to be a whole number")
+            return
+        else:
+            self.filters[kind][order_by] = value
+        self.apply_source(kind)
+
+    def show_headings(self, kind):
+        # arrow on the sorted column, the filter value after any filtered one. neither
+        # applies to search results, so they come off while the search box has text
+        order_by, descending = self.order[kind]
+        for column, db_column in self.SORT_COLUMNS[kind].items():
+            text = self.titles[kind][column]
+            if db_column in self.filters[kind] and not self.search_text:
+                text += f" = {self.filters[kind][db_column]}"
+            if db_column == order_by and not self.search_text:
+                text += " \u25bc" if descending else " \u25b2"
+            self.views[kind].tree.heading(column, text=text)
+
+    def apply_source(self, kind):
+        ''' point one treeview at its rows: the search results while the search
+            box has text, otherwise every row matching the column filters in
+            the heading order
+        '''
+        self.show_headings(kind)
+        text = self.search_text
+        if text:
+            self.views[kind].set_source(lambda storage: getattr(storage, f'count_search_{kind}')(text),
+                                        getattr(self, f'search_fetch_{kind}')(text),
+                                        getattr(self, f'fetch_{kind}_ids'))
+        else:
+            self.views[kind].set_source(*self.table_source(kind))
+
+    def on_search_typed(self, *args):
+        # every keystroke pushes the search back, so it only runs once typing pauses
+        if self.search_job is not None:
+            self.after_cancel(self.search_job)
+        self.search_job = self.after(self.SEARCH_DELAY_MS, self.run_search)
+
+    def run_search(self):
+        ''' point both treeviews at the rows matching the search box, or back at
+            every row when it is empty. the queries run on the db worker like
+            any other window load
+        '''
+        self.search_job = None
+        text = self.search.get().strip()
+        if search_query(text) is None:
+            text = ""
+        if text == self.search_text:
+            return
+        self.search_text = text
+        for kind in self.views:
+            self.apply_source(kind)
+
+    def set_version(self, version):
+        self.version = version
+
+    def reload(self):
+        # every row again, from the version they are read at
+        self.persist.submit('get_change_version', callback=self.set_version)
+        self.booking_view.refresh()
+        self.inventory_view.refresh()
+
+    def check_snapshot(self, storage, version, held):
+        # runs on the db worker: the change feed since the snapshot, the same as update() uses
+        if storage.get_change_version() < version:
+            return None     # the db is older than the snapshot, e.g. a restored backup
+        return self.load_changes(storage, version, held)
+
+    def snapshot_checked(self, result):
+        if result is None:
+            self.reload()
+        else:
+            self.apply_changes(result)
+
+    def preload_snapshot(self):
+        ''' fill both treeviews from the snapshot the last run left behind, read
+            straight from the file on the tk thread so they show before the
+            worker has the db open. returns its change version, None without one
+        '''
+        snapshot = browse_snapshot.read(snapshot_path())
+        if snapshot is None:
+            return None
+        version, tables = snapshot
+        if 'booking' not in tables or 'items' not in tables:
+            return None
+        for view, table in ((self.booking_view, 'booking'), (self.inventory_view, 'items')):
+            total, rows = tables[table]
+            # blank, not None, for bookings without a stay, same as booking_values
+            view.preload(total, [tuple("" if value is None else value for value in row) for row in rows])
+        self.controller.mark_startup('snapshot shown')
+        return version
+
+    def load(self):
+        ''' the one full load, when the page is first shown: the first window of
+            both tables. the version lets update() ask the db for just the rows
+            changed since then. rows preloaded from a snapshot are kept and only
+            what changed since it was taken is fetched
+        '''
+        self.loaded = True
+        if self.snapshot_version is None:
+            self.reload()
+        else:
+            self.version = self.snapshot_version
+            self.persist.submit(self.check_snapshot, self.snapshot_version, self.held_ids(),
+                                callback=self.snapshot_checked)
+        self.stock_report.refresh()
+        # the worker takes requests in order, so this comes back once the rows above are in
+        self.persist.submit(count_rows, callback=self.controller.data_loaded)
+        self.after(self.CHANGE_POLL_MS, self.poll_external_changes)
+
+    def poll_external_changes(self):
+        # data_version only moves when another connection commits, so checking it reads no rows
+        self.persist.submit('has_external_changes', callback=self.on_external_changes, key='external changes',
+                            background=True)
+        self.after(self.CHANGE_POLL_MS, self.poll_external_changes)
+
+    def on_external_changes(self, changed):
+        # the change feed says which rows, the same as after our own saves
+        if changed:
+            self.update()
 
     def update(self):
-        ''' to refresh the treeview, delete all its rows and repopulate from the db 
+        ''' to refresh the treeview, ask the db which rows changed since the last
+            refresh and only apply those to the treeviews.
+            repeated refreshes that pile up while the worker is busy collapse into one
         '''
-        # deletes booking records
-        for row in self.tree.get_children():
-            self.tree.delete(row)
-        # inserts them
-        all_records = self.persist.get_all_sorted_records_booking()
-        for record in all_records:
-            self.tree.insert("", 0, values=(
-                record.rid, record.room, record.guests, record.name, record.email))
-
-        # deletes inventory records
-        for row in self.treeInventory.get_children():
-            self.treeInventory.delete(row)
-        # inserts them
-        all_records = self.persist.get_all_sorted_records_inventory()
-        for record in all_records:
-            self.treeInventory.insert("", 0, values=(
-                record.rid, record.item, record.quantity))
+        if not self.loaded:
+            self.load()
+            return
+        self.persist.submit(self.load_changes, self.version, self.held_ids(), callback=self.apply_changes,
+                            key='browse changes')
+
+    def held_ids(self):
+        # the rows each treeview has cached, only their edits need fetching
+        return self.booking_view.held_ids(), self.inventory_view.held_ids()
+
+    def load_changes(self, storage, version, held):
+        # runs on the db worker: the changes plus everything needed to apply them
+        if version is None:     # the first load is still on its way
+            return storage.get_change_version(), {'booking': {}, 'items': {}}, None, None
+        version, changes = storage.get_changes_since(version)
+        return (version, changes,
+                self.booking_view.collect_changes(storage, changes['booking'], held[0]),
+                self.inventory_view.collect_changes(storage, changes['items'], held[1]))
+
+    def apply_changes(self, result):
+        self.version, changes, booking, inventory = result
+        self.booking_view.apply_changes(changes['booking'], booking)
+        self.inventory_view.apply_changes(changes['items'], inventory)
+        if changes['items']:
+            self.stock_report.refresh()
+
+
+def booking_values(record):
+    # one booking as a row of the booking treeview, blank dates for bookings without a stay
+    return (record.rid, record.room, record.guests, record.name, record.email,
+            record.check_in or "", record.check_out or "")
+
+
+def inventory_values(record):
+    # one inventory record as a row of the inventory treeview
+    return (record.rid, record.quantity, record.item)
+
+
+def confirm_double_booking(conflicts):
+    ''' the stay clashes with other bookings for the room, list them and ask
+        whether to save it anyway
+    '''
+    lines = [f"#{booking.rid} {booking.name}: {booking.check_in} to {booking.check_out}"
+             for booking in conflicts[:10]]
+    if len(conflicts) > 10:
+        lines.append(f"and {len(conflicts) - 10} more")
+    return messagebox.askyesno("Room already booked", f"Room {conflicts[0].room} is already booked by\n\n"
+                               + "\n".join(lines) + "\n\nSave this booking anyway?", default=messagebox.NO)
+
+
+def suggester(persist, table, column):
+    ''' an EntryField suggest function: the lookup runs on the db worker, and
+        while it is busy newer keystrokes replace the queued one
+    '''
+    def suggest(text, show):
+        persist.submit('suggest', table, column, text, callback=lambda values: show(text, values),
+                       key=('suggest', table, column))
+    return suggest
+
+
+def count_rows(storage):
+    # runs on the db worker, the table sizes for the startup report
+    return storage.count_records_booking(), storage.count_records_inventory()
+
+
+def read_stock_report(storage, rows):
+    # runs on the db worker, everything comes from the running totals so it costs the same at any size
+    return storage.get_stock_total(), storage.get_item_totals(rows, lowest_first=True), storage.LOW_STOCK
+
+
+class StockReport(tk.Frame):
+    ''' total stock and the per item totals, lowest first, with the items
+        that are running low in red. the numbers come from the summary
+        tables the db keeps current, so refreshing never scans the inventory
+    '''
+    ROWS = 100      # item totals shown, the low ones come first so they always make it
+
+    def __init__(self, parent, persist):
+        tk.Frame.__init__(self, parent)
+        self.persist = persist
+        self.total = tk.Label(self, text="", anchor=tk.W)
+        self.total.pack(fill="x")
+        scrollbar = tk.Scrollbar(self, orient=tk.VERTICAL)
+        self.tree = ttk.Treeview(self, columns=("item", "quantity"), show="headings", height=9,
+                                 yscrollcommand=scrollbar.set)
+        scrollbar.config(command=self.tree.yview)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.tree.pack()
+        self.tree.heading('item', text="Item", anchor=tk.W)
+        self.tree.heading('quantity', text="Total", anchor=tk.W)
+        self.tree.column('item', stretch=tk.NO, minwidth=0, width=150)
+        self.tree.column('quantity', stretch=tk.NO, minwidth=0, width=70)
+        self.tree.tag_configure('low', foreground="red")
+
+    def refresh(self):
+        self.persist.submit(read_stock_report, self.ROWS, callback=self.show, key='stock report')
+
+    def show(self, report):
+        (quantity, records), totals, threshold = report
+        self.total.config(text=f"Total stock {quantity} over {records} records, "
+                               f"low stock is {threshold} or less")
+        self.tree.delete(*self.tree.get_children())
+        for item, quantity, records in totals:
+            self.tree.insert("", tk.END, values=(item, quantity),
+                             tags=('low',) if quantity <= threshold else ())
+
+
+def read_stats(storage):
+    # runs on the db worker, None when the storage isn't instrumented
+    if hasattr(storage, 'stats'):
+        return storage.stats.snapshot()
+    return None
+
+
+def dump_stats(storage, path):
+    # runs on the db worker, returns whether there was anything to write
+    if not hasattr(storage, 'stats'):
+        return False
+    storage.stats.dump(path)
+    return True
+
+
+class StatsPanel(tk.Toplevel):
+    ''' debug window showing the storage call counts, latencies and slow calls,
+        refreshed every second. the numbers only exist when the app was
+        started with STORAGE_STATS=1
+    '''
+    REFRESH_MS = 1000
+
+    def __init__(self, parent, persist):
+        tk.Toplevel.__init__(self, parent)
+        self.title("Storage Stats")
+        self.persist = persist
+        self.text = tk.Text(self, width=110, height=30, font=("Courier", 10))
+        self.text.pack(fill="both", expand=True)
+        self.message = tk.Label(self, text="", anchor=tk.W)
+        self.message.pack(side="left", fill="x", expand=True)
+        dump_button = tk.Button(self, text="Dump JSON", command=self.dump)
+        dump_button.pack(side="right")
+        self.job = None
+        self.refresh()
+
+    def refresh(self):
+        self.persist.submit(read_stats, callback=self.show, key='stats panel', background=True)
+        self.job = self.after(self.REFRESH_MS, self.refresh)
+
+    def show(self, stats):
+        if not self.winfo_exists():
+            return
+        self.text.delete("1.0", tk.END)
+        if stats is None:
+            self.text.insert(tk.END, "instrumentation is off, start the app with STORAGE_STATS=1\n")
+            return
+        lines = [f"commits {stats['commits']}   statements {stats['statements']}   "
+                 f"uptime {stats['uptime_s']:.0f} s",
+                 "",
+                 f"{'method':<32}{'calls':>8}{'mean ms':>10}{'max ms':>10}{'rows':>10}   histogram "
+                 f"(<= {', '.join(str(edge) for edge in stats['buckets_ms'])}, more)"]
+        # the most expensive methods first
+        for name, counters in sorted(stats['methods'].items(), key=lambda item: -item[1]['total_ms']):
+            lines.append(f"{name:<32}{counters['calls']:>8}{counters['mean_ms']:>10.2f}"
+                         f"{counters['max_ms']:>10.2f}{counters['rows']:>10}   {counters['histogram']}")
+        lines += ["", "slow calls"]
+        for entry in reversed(stats['slow']):
+            lines.append(f"{entry['at']} {entry['method']} {entry['ms']} ms: {'; '.join(entry['sql'])}")
+        self.text.insert(tk.END, "\n".join(lines))
+
+    def dump(self):
+        path = time.strftime("storage_stats_%Y%m%d_%H%M%S.json")
+        self.persist.submit(dump_stats, path, callback=lambda dumped: self.message.config(
+            text=f"wrote {path}" if dumped else "instrumentation is off"))
+
+    def destroy(self):
+        # stop refreshing once the window is closed
+        if self.job is not None:
+            self.after_cancel(self.job)
+        tk.Toplevel.destroy(self)
+
+
+class BulkEditDialog(tk.Toplevel):
+    ''' one form for many selected rows. the fields that are filled in are
+        set on every row with one UPDATE in one transaction, the blank ones
+        are left as each row has them. the browse page is patched from the
+        change feed afterwards, like after any other save
+    '''
+    # per kind: (label, column) for each field, the columns are SQLStorage.BULK_COLUMNS
+    FIELDS = {
+        'booking': (('Room #', 'room'), ('# of guests', 'guests'), ('Name', 'name'), ('Email', 'email')),
+        'inventory': (('Item', 'item'), ('Quantity', 'quantity')),
+    }
+    TABLES = {'booking': 'booking', 'inventory': 'items'}
+
+    def __init__(self, parent, controller, persist, kind, rids, on_saved):
+        tk.Toplevel.__init__(self, parent)
+        self.controller = controller
+        self.persist = persist
+        self.kind = kind
+        self.rids = rids
+        self.on_saved = on_saved    # called once the rows are saved
+        self.changes = None
+        what = "bookings" if kind == 'booking' else "inventory records"
+        self.title(f"Edit {len(rids)} {what}")
+        self.transient(parent)
+        label = tk.Label(self, text=f"Edit {len(rids)} {what}", font=controller.title_font)
+        label.grid(row=0, column=0)
+        hint = tk.Label(self, text="Blank fields are left as they are")
+        hint.grid(row=1, column=0)
+        self.data = {}
+        for row, (text, column) in enumerate(self.FIELDS[kind], start=2):
+            suggest = suggester(persist, self.TABLES[kind], column) \
+                if column in ('name', 'email', 'item') else None
+            self.data[column] = entry_field.EntryField(self, label=text, suggest=suggest)
+            self.data[column].grid(row=row, column=0, pady=2)
+        buttons = tk.Frame(self)
+        buttons.grid(row=len(self.data) + 2, column=0, pady=10)
+        apply_button = tk.Button(buttons, text=f"Update {len(rids)} records", activebackground="green",
+                                 activeforeground="blue", command=self.submit)
+        apply_button.grid(row=0, column=0, padx=5)
+        cancel_button = tk.Button(buttons, text="Cancel", command=self.destroy)
+        cancel_button.grid(row=0, column=1, padx=5)
+
+    def submit(self):
+        self.changes = {column: field.get() for column, field in self.data.items() if field.get().strip()}
+        if not self.changes:
+            self.destroy()
+            return
+        # moving bookings to another room is checked for nights they would share, like the booking form
+        self.persist.submit(f'update_records_{self.kind}', self.rids, self.changes, callback=self.checked,
+                            errback=self.controller.show_error)
+
+    def checked(self, conflicts):
+        if conflicts:
+            if confirm_double_booking(conflicts):
+                self.persist.submit('update_records_booking', self.rids, self.changes, False,
+                                    callback=self.checked, errback=self.controller.show_error)
+            return
+        self.on_saved()
+        self.destroy()
 
 
 class ReadPageBooking(tk.Frame):
@@ -246,39 +850,75 @@ class ReadPageBooking(tk.Frame):
         self.data['Guests'] = entry_field.EntryField(self, label='# of guests')
         self.data['Guests'].grid(row=2, column=0, pady=2)
 
-        self.data['Name'] = entry_field.EntryField(self, label='Name')
+        self.data['Name'] = entry_field.EntryField(self, label='Name',
+                                                   suggest=suggester(persist, 'booking', 'name'))
         self.data['Name'].grid(row=3, column=0, pady=2)
 
-        self.data['Email'] = entry_field.EntryField(self, label='Email')
+        self.data['Email'] = entry_field.EntryField(self, label='Email',
+                                                    suggest=suggester(persist, 'booking', 'email'))
         self.data['Email'].grid(row=4, column=0, pady=2)
 
+        # dates are YYYY-MM-DD, leave both blank for a booking without a stay
+        self.data['Check in'] = entry_field.EntryField(self, label='Check in')
+        self.data['Check in'].grid(row=5, column=0, pady=2)
+
+        self.data['Check out'] = entry_field.EntryField(self, label='Check out')
+        self.data['Check out'].grid(row=6, column=0, pady=2)
+
         # button to update the entry according to changes made
         self.Button1 = tk.Button(self, text='Update', activebackground="green",
                                  activeforeground="blue", command=self.submit)
-        self.Button1.grid(row=5, column=0, pady=10)
+        self.Button1.grid(row=7, column=0, pady=10)
 
         # return to browse page when user is finished
         button = tk.Button(self, text="Return to the browse page",
                            command=lambda: controller.show_frame("BrowsePage"))
-        button.grid(row=6, column=0)
+        button.grid(row=8, column=0)
 
     def update(self, rid):
-        record = self.controller.data.get_record_booking(rid)
+        # one fetch, the storage's identity map makes repeat edits free
+        # the fields stay blank until the worker hands the record back
+        self.booking = None
+        for key in self.data:
+            self.data[key].reset()
+        self.persist.submit('get_record_booking', rid, callback=self.show_record)
+
+    def show_record(self, record):
+        self.booking = record
         # all the fields that booking uses and updates
         self.data['Room'].dataentry.set(record.room)
         self.data["Guests"].dataentry.set(record.guests)
         self.data["Name"].dataentry.set(record.name)
         self.data['Email'].dataentry.set(record.email)
-        self.booking = self.persist.get_record_booking(rid)
+        self.data['Check in'].dataentry.set(record.check_in or "")
+        self.data['Check out'].dataentry.set(record.check_out or "")
 
     def submit(self):
         ''' grab the text placed in the entry widgets accessed through the dict 
             used for booking entries'''
+        if self.booking is None:    # still loading
+            return
         self.booking.room = self.data['Room'].get()
         self.booking.guests = self.data['Guests'].get()
         self.booking.name = self.data['Name'].get()
         self.booking.email = self.data['Email'].get()
-        self.persist.save_record_booking(self.booking)
+        self.booking.check_in = self.data['Check in'].get()
+        self.booking.check_out = self.data['Check out'].get()
+        # the room is checked for other bookings on those nights before anything is saved
+        self.persist.submit('save_record_booking_checked', self.booking, callback=self.checked,
+                            errback=self.save_failed)
+
+    def checked(self, conflicts):
+        if conflicts and confirm_double_booking(conflicts):
+            self.persist.submit('save_record_booking', self.booking, errback=self.save_failed)
+
+    def save_failed(self, error):
+        if not isinstance(error, ConflictError):
+            self.controller.show_error(error)
+            return
+        # someone else saved this booking first, theirs stays unless the user types it in again
+        if messagebox.askyesno("Edit conflict", f"{error}.\n\nLoad their version? Your changes will be lost."):
+            self.update(self.booking.rid)
 
 class ReadPageInventory(tk.Frame):
     ''' similar to ReadPageInventory but for inventory entries
@@ -298,7 +938,8 @@ class ReadPageInventory(tk.Frame):
         self.data = {}
         """ Use EntryField classes to set up the form, along with a submit button
             all the entries for inventory """
-        self.data['Item'] = entry_field.EntryField(self, label='Item')
+        self.data['Item'] = entry_field.EntryField(self, label='Item',
+                                                   suggest=suggester(persist, 'items', 'item'))
         self.data['Item'].grid(row=1, column=0, pady=2)
 
         self.data['Quantity'] = entry_field.EntryField(self, label='Quantity')
@@ -315,18 +956,35 @@ class ReadPageInventory(tk.Frame):
         button.grid(row=6, column=0)
 
     def update(self, rid):
-        record = self.controller.data.get_record_inventory(rid)
+        # one fetch, the storage's identity map makes repeat edits free
+        # the fields stay blank until the worker hands the record back
+        self.items = None
+        for key in self.data:
+            self.data[key].reset()
+        self.persist.submit('get_record_inventory', rid, callback=self.show_record)
+
+    def show_record(self, record):
+        self.items = record
         # all fields for inventory
         self.data['Item'].dataentry.set(record.item)
         self.data["Quantity"].dataentry.set(record.quantity)
-        self.items = self.persist.get_record_inventory(rid)
 
     def submit(self):
         ''' grab the text placed in the entry widgets accessed through the dict 
             used for inventory entries'''
+        if self.items is None:  # still loading
+            return
         self.items.item = self.data['Item'].get()
         self.items.quantity = self.data['Quantity'].get()
-        self.persist.save_record_inventory(self.items)
+        self.persist.submit('save_record_inventory', self.items, errback=self.save_failed)
+
+    def save_failed(self, error):
+        if not isinstance(error, ConflictError):
+            self.controller.show_error(error)
+            return
+        # someone else saved this item first, theirs stays unless the user types it in again
+        if messagebox.askyesno("Edit conflict", f"{error}.\n\nLoad their version? Your changes will be lost."):
+            self.update(self.items.rid)
 
 class CreatePageBooking(tk.Frame):
     ''' provides a form for creating a new booking entry
@@ -351,21 +1009,30 @@ class CreatePageBooking(tk.Frame):
         self.data['Guests'] = entry_field.EntryField(self, label='# of guests')
         self.data['Guests'].grid(row=2, column=0, pady=2)
 
-        self.data['Name'] = entry_field.EntryField(self, label='Name')
+        self.data['Name'] = entry_field.EntryField(self, label='Name',
+                                                   suggest=suggester(persist, 'booking', 'name'))
         self.data['Name'].grid(row=3, column=0, pady=2)
 
-        self.data['Email'] = entry_field.EntryField(self, label='Email')
+        self.data['Email'] = entry_field.EntryField(self, label='Email',
+                                                    suggest=suggester(persist, 'booking', 'email'))
         self.data['Email'].grid(row=4, column=0, pady=2)
 
+        # dates are YYYY-MM-DD, leave both blank for a booking without a stay
+        self.data['Check in'] = entry_field.EntryField(self, label='Check in')
+        self.data['Check in'].grid(row=5, column=0, pady=2)
+
+        self.data['Check out'] = entry_field.EntryField(self, label='Check out')
+        self.data['Check out'].grid(row=6, column=0, pady=2)
+
         # submit/add a new entry when filled out
         self.Button1 = tk.Button(self, text='Submit', activebackground="green",
                                  activeforeground="blue", command=self.submit)
-        self.Button1.grid(row=5, column=0, pady=10)
+        self.Button1.grid(row=7, column=0, pady=10)
 
         # return to browse page when finished
         button = tk.Button(self, text="Return to the browse page",
                            command=lambda: controller.show_frame("BrowsePage"))
-        button.grid(row=6, column=0)
+        button.grid(row=8, column=0)
 
     def reset(self):
         ''' on every new entry, blank out the fields
@@ -382,9 +1049,18 @@ class CreatePageBooking(tk.Frame):
         b = Booking(name=self.data['Name'].get(),
                     room=self.data['Room'].get(),
                     guests=self.data['Guests'].get(),
-                    email=self.data['Email'].get())
-        self.persist.save_record_booking(b)
-        self.update()
+                    email=self.data['Email'].get(),
+                    check_in=self.data['Check in'].get(),
+                    check_out=self.data['Check out'].get())
+        # the room is checked for other bookings on those nights first,
+        # and the form is only cleared once the record is saved
+        self.persist.submit('save_record_booking_checked', b, callback=lambda conflicts: self.checked(b, conflicts))
+
+    def checked(self, booking, conflicts):
+        if not conflicts:
+            self.update()
+        elif confirm_double_booking(conflicts):
+            self.persist.submit('save_record_booking', booking, callback=lambda result: self.update())
 
 class CreatePageInventory(tk.Frame):
     ''' provides a form for creating a new Contact
@@ -404,7 +1080,8 @@ class CreatePageInventory(tk.Frame):
         self.data = {}
         """ Use EntryField classes to set up the form, along with a submit button
             fields for user to fill"""
-        self.data['Item'] = entry_field.EntryField(self, label='Item')
+        self.data['Item'] = entry_field.EntryField(self, label='Item',
+                                                   suggest=suggester(persist, 'items', 'item'))
         self.data['Item'].grid(row=1, column=0, pady=2)
 
         self.data['Quantity'] = entry_field.EntryField(self, label='Quantity')
@@ -434,8 +1111,8 @@ class CreatePageInventory(tk.Frame):
         '''
         i = Inventory(item=self.data['Item'].get(),
                     quantity=self.data['Quantity'].get())
-        self.persist.save_record_inventory(i)
-        self.update()
+        # the form is only cleared once the record is saved
+        self.persist.submit('save_record_inventory', i, callback=lambda result: self.update())
 
 
 if __name__ == "__main__":
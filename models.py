@@ -1,54 +1,452 @@
 import shelve
 import sqlite3
+import time
+from collections import OrderedDict
+from datetime import date
+
+import browse_snapshot
+import init_db
+
+
+class ConflictError(Exception):
+    ''' a save was refused because the row changed (or went away) since the
+        record was read, usually an edit from another machine
+    '''
 
 
 class SQLStorage():
     ''' Represents a persistence layer provided using sqlite
     '''
     FILENAME = "sql_data.db"
-
-    def __init__(self):
+    CACHE_SIZE = 1000   # records kept in the identity map
+    LOW_STOCK = 10      # item totals at or below this count as low stock
+    BUSY_TIMEOUT = 5.0  # seconds a write waits for another connection to finish before giving up
+    # write-behind mode flushes its buffer once it holds this many records or the oldest is this old
+    WRITE_BEHIND_SIZE = 50
+    WRITE_BEHIND_SECONDS = 1.0
+    CLOSE_FLUSH_TRIES = 3       # flushes cleanup() tries before giving up on a db that stays locked
+    # the saves write-behind mode buffers, every other public call flushes the buffer first
+    BUFFERED = ('save_record_booking', 'save_record_booking_checked', 'save_record_inventory')
+    # calls that neither read nor write records so they don't need to flush
+    NO_FLUSH = ('flush', 'flush_if_due', 'flushing', 'buffer_record', 'write_booking', 'write_inventory',
+                'cleanup', 'has_external_changes', 'cache_get', 'cache_put', 'cache_drop', 'cache_clear',
+                'cache_stats', 'get_buffered_conflicts')
+    # columns each table can be ordered and filtered by in get_page_*, init_db indexes every one of them
+    SORT_COLUMNS = {
+        'booking': ('booking_id', 'room', 'guests', 'name', 'email'),
+        'items': ('item_id', 'item', 'quantity'),
+    }
+    # filters on these match the whole number, on the other columns they match the start of the text
+    NUMBER_COLUMNS = ('booking_id', 'guests', 'item_id', 'quantity')
+    # what the browse page shows for each table, saved by write_browse_snapshot
+    BROWSE_COLUMNS = {
+        'booking': ('booking_id', 'room', 'guests', 'name', 'email', 'check_in', 'check_out'),
+        'items': ('item_id', 'quantity', 'item'),
+    }
+    SNAPSHOT_ROWS = 100     # newest rows of each table in the snapshot, one browse page
+    SUGGEST_LIMIT = 10      # values suggest returns by default
+    # columns update_records_* can set on many rows at once. stay dates are left to
+    # the one booking forms, every stay needs its own dates
+    BULK_COLUMNS = {
+        'booking': ('room', 'guests', 'name', 'email'),
+        'items': ('item', 'quantity'),
+    }
+    BULK_CHUNK = 500        # ids per UPDATE, well under sqlite's limit on parameters
+
+    def __init__(self, filename=None, cache_size=None, check_same_thread=True, timeout=None,
+                 write_behind=False, browse_snapshot=False):
         ''' initiate access to the data persistence layer
+            filename defaults to FILENAME, other files are handy for benchmarks
+            cache_size is how many records the identity map holds, 0 turns it off
+            check_same_thread=False is only for pools that hand the object to
+            one thread at a time
+            timeout is how long to wait on another connection's write lock,
+            defaults to BUSY_TIMEOUT
+            write_behind=True holds save_record_* back and commits them in
+            groups, see buffer_record
+            browse_snapshot=True saves the browse page's first rows when
+            cleaning up, see write_browse_snapshot
         '''
-        self.conn = sqlite3.connect(self.FILENAME)
+        # identity map: (table, rid) -> record, least recently used first
+        self.cache = OrderedDict()
+        self.cache_size = self.CACHE_SIZE if cache_size is None else cache_size
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.filename = filename or self.FILENAME
+        self.browse_snapshot = browse_snapshot
+        self.conn = sqlite3.connect(self.filename, check_same_thread=check_same_thread,
+                                    timeout=self.BUSY_TIMEOUT if timeout is None else timeout)
+        # several machines share the file: with WAL readers never wait on a writer
+        # and a writer only waits for the other writer
+        self.conn.execute("""PRAGMA journal_mode=WAL;""")
         self.data_access = self.conn.cursor()
         # data_access is now a cursor object
+        # these two build Booking / Inventory objects straight from each row
+        self.readers = {'booking': self.conn.cursor(), 'items': self.conn.cursor()}
+        self.readers['booking'].row_factory = booking_from_row
+        self.readers['items'].row_factory = inventory_from_row
+        # brings an old or empty file up to the current schema, a no-op once it is
+        init_db.migrate(self.conn)
+        self.data_version = self.conn.execute("""PRAGMA data_version;""").fetchone()[0]
+        # write-behind buffer: id(record) -> (table, record), oldest first
+        self.pending = {}
+        self.pending_since = None
+        self.write_behind = write_behind
+        if write_behind:
+            # everything else sees the buffered records, so only back to back saves are grouped.
+            # the bound methods are replaced on the instance like instrument() does
+            for name in dir(type(self)):
+                if name.startswith('_') or name in self.BUFFERED or name in self.NO_FLUSH \
+                        or not callable(getattr(type(self), name)):
+                    continue
+                setattr(self, name, self.flushing(getattr(self, name)))
+
+    def flushing(self, method):
+        # method, but writing out the write-behind buffer first
+        def flushed_first(*args, **kwargs):
+            self.flush()
+            return method(*args, **kwargs)
+        flushed_first.__name__ = method.__name__
+        flushed_first.__doc__ = method.__doc__
+        return flushed_first
+
+    def buffer_record(self, table, record):
+        ''' write-behind mode: hold a saved record back so a run of saves shares
+            one transaction and one fsync instead of paying for one each. the
+            buffer is written once it reaches WRITE_BEHIND_SIZE records or
+            WRITE_BEHIND_SECONDS of age, by any other call, by flush() and by
+            cleanup(). errors such as a ConflictError come out of whichever
+            call does the flush
+        '''
+        if not self.pending:
+            self.pending_since = time.monotonic()
+        # saving the same object twice before a flush only writes it once
+        self.pending[id(record)] = (table, record)
+        if record.rid != 0:
+            self.cache_put(table, record)
+        self.flush_if_due()
+
+    def flush_if_due(self):
+        ''' flush when the buffer is full or old enough. the db worker also
+            calls this when it has nothing else to do
+        '''
+        if self.pending and (len(self.pending) >= self.WRITE_BEHIND_SIZE
+                             or time.monotonic() - self.pending_since >= self.WRITE_BEHIND_SECONDS):
+            self.flush()
+
+    def flush(self):
+        ''' write everything in the write-behind buffer in one transaction.
+            if any record fails the rest are still saved one at a time and
+            the first error is raised. a record the db refused (IntegrityError,
+            ConflictError) is dropped, one that only hit a locked or busy db
+            goes back in the buffer for the next flush
+        '''
+        if not self.pending:
+            return
+        pending = list(self.pending.values())
+        self.pending.clear()
+        writers = {'booking': self.write_booking, 'items': self.write_inventory}
+        # a rolled back batch has to hand back the ids and versions it gave out
+        before = [(record.rid, record.version) for table, record in pending]
+        try:
+            with self.conn:
+                for table, record in pending:
+                    writers[table](record)
+        except (sqlite3.Error, ConflictError):
+            for (table, record), (rid, version) in zip(pending, before):
+                record.rid, record.version = rid, version
+            errors = []
+            for (table, record), (rid, version) in zip(pending, before):
+                try:
+                    with self.conn:
+                        writers[table](record)
+                except sqlite3.OperationalError as e:
+                    # a locked or busy db, not the record's fault: back in the buffer as it was
+                    record.rid, record.version = rid, version
+                    if not self.pending:
+                        self.pending_since = time.monotonic()
+                    self.pending[id(record)] = (table, record)
+                    errors.append(e)
+                except (sqlite3.Error, ConflictError) as e:
+                    self.cache_drop(table, [record.rid])
+                    errors.append(e)
+                else:
+                    self.cache_put(table, record)
+            # a busy db can fail the batch and then let every record through on its own.
+            # a record that was refused is worse news than one still in the buffer
+            if errors:
+                raise next((e for e in errors if not isinstance(e, sqlite3.OperationalError)), errors[0])
+            return
+        for table, record in pending:
+            self.cache_put(table, record)
+
+    def cache_get(self, table, rid):
+        # return the cached record or None, counting the hit or miss
+        record = self.cache.get((table, int(rid)))
+        if record is None:
+            self.cache_misses += 1
+        else:
+            self.cache_hits += 1
+            self.cache.move_to_end((table, int(rid)))
+        return record
+
+    def cache_put(self, table, record):
+        if self.cache_size <= 0:
+            return
+        self.cache[(table, record.rid)] = record
+        self.cache.move_to_end((table, record.rid))
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+    def cache_drop(self, table, rids):
+        for rid in rids:
+            self.cache.pop((table, int(rid)), None)
+
+    def cache_clear(self):
+        # for when something outside this object may have changed the tables
+        self.cache.clear()
+
+    def cache_stats(self):
+        lookups = self.cache_hits + self.cache_misses
+        return {'hits': self.cache_hits, 'misses': self.cache_misses, 'size': len(self.cache),
+                'capacity': self.cache_size, 'hit_rate': self.cache_hits / lookups if lookups else 0.0}
+
+    def get_change_version(self):
+        # the version token for the current state of both tables
+        self.data_access.execute("""SELECT COALESCE(MAX(seq), 0) from change_log;""")
+        return self.data_access.fetchone()[0]
+
+    def has_external_changes(self):
+        ''' True when another connection has committed since the last call.
+            costs no reads at all, so it can be polled. the identity map is
+            emptied when it happens since the cached records may be out of date
+        '''
+        version = self.conn.execute("""PRAGMA data_version;""").fetchone()[0]
+        changed = version != self.data_version
+        self.data_version = version
+        if changed:
+            self.cache_clear()
+        return changed
+
+    def get_changes_since(self, version):
+        ''' return (new version, changes) where changes maps 'booking' and 'items'
+            to a dict of {rid: 'insert' / 'update' / 'delete'} for every row
+            touched after the given version
+        '''
+        changes = {'booking': {}, 'items': {}}
+        self.data_access.execute(
+            """SELECT seq, tbl, rid, op from change_log WHERE seq > ? ORDER BY seq;""", (version,))
+        for seq, table, rid, op in self.data_access:
+            changes[table][rid] = op
+            version = seq
+        return version, changes
 
     def get_record_booking(self, rid):
         ''' return a single record identified by the record id
             takes the data from the columns in the hotel booking database
         '''
-        self.data_access.execute(
-            """SELECT * from booking WHERE booking_id= ?;""", (rid,))
-        row = self.data_access.fetchone()
-        booking = Booking(row[1], row[2], row[3], row[4], row[0])
-        return booking
+        record = self.cache_get('booking', rid)
+        if record is None:
+            reader = self.readers['booking']
+            reader.execute(
+                """SELECT * from booking WHERE booking_id= ?;""", (rid,))
+            record = reader.fetchone()
+            if record is not None:
+                self.cache_put('booking', record)
+        return record
 
     def get_all_records_booking(self):
         ''' return all records stored in the hotel booking database
         '''
-        self.data_access.execute("""SELECT * from booking;""")
-        booking = []    # adds all of the records in a list
-        for row in self.data_access:
-            booking.append(
-                Booking(row[1], row[2], row[3], row[4], row[0]))
-        return booking
+        return list(self.iter_records_booking())
+
+    def iter_records_booking(self, batch_size=1000):
+        ''' lazily yield every hotel booking record, batch_size rows at a time,
+            so only one batch of records is in memory at once
+        '''
+        yield from self.iter_records('booking', batch_size)
 
     def save_record_booking(self, record):
         ''' add a record represented by a dict with a new id
             saves new records and edited records for hotel booking
+            an edit raises ConflictError if the row changed since the record was read
         '''
+        if self.write_behind:
+            self.buffer_record('booking', record)
+            return
+        try:
+            with self.conn:     # rolled back if the row breaks a constraint, e.g. guests not a number
+                self.write_booking(record)
+        except (sqlite3.Error, ConflictError):
+            # the caller may have edited the cached object itself, don't hand it out again
+            self.cache_drop('booking', [record.rid])
+            raise
+        self.cache_put('booking', record)   # write through so the next get is free
+
+    def write_booking(self, record):
+        # the insert or update behind save_record_booking, the caller commits
         if record.rid == 0:     # if new record:
-            self.data_access.execute("""INSERT INTO booking(room, guests, name, email) VALUES (?,?,?,?)
-            """, (record.room, record.guests, record.name, record.email))
+            self.data_access.execute("""INSERT INTO booking(room, guests, name, email, check_in, check_out)
+            VALUES (?,?,?,?,?,?)""", (record.room, record.guests, record.name, record.email,
+                                      record.check_in or None, record.check_out or None))
             record.rid = self.data_access.lastrowid
         else:   # if old record / updating a record
-            self.data_access.execute("""UPDATE booking SET room = ?, guests = ?,name = ?, email = ?
-            WHERE booking_id = ?""", (record.room, record.guests, record.name, record.email, record.rid))
-        self.conn.commit()
+            # only if nobody else saved it since we read it
+            self.data_access.execute("""UPDATE booking SET room = ?, guests = ?,name = ?, email = ?,
+            check_in = ?, check_out = ?, version = version + 1 WHERE booking_id = ? AND version = ?""",
+                                     (record.room, record.guests, record.name, record.email,
+                                      record.check_in or None, record.check_out or None, record.rid,
+                                      record.version))
+            if self.data_access.rowcount == 0:
+                raise ConflictError(f'booking {record.rid} was changed or deleted by someone else')
+            record.version += 1
+
+    def save_record_booking_checked(self, record):
+        ''' save_record_booking, but only when the room is free for the whole
+            stay. returns the clashing bookings without saving anything, or an
+            empty list once it is saved. the check and the save share one write
+            transaction so two machines can't book the same night between them.
+            in write-behind mode the record is checked against the db and the
+            buffer and then buffered, so until the flush another machine could
+            still take the same night. raises ValueError for dates that aren't
+            YYYY-MM-DD
+        '''
+        try:
+            record.check_in, record.check_out = check_stay(record.check_in, record.check_out)
+            if self.write_behind:
+                conflicts = self.get_buffered_conflicts(record)
+                if not conflicts:
+                    self.buffer_record('booking', record)
+            else:
+                with self.conn:
+                    self.conn.execute("""BEGIN IMMEDIATE;""")
+                    conflicts = self.get_booking_conflicts(record)
+                    if not conflicts:
+                        self.write_booking(record)
+        except (ValueError, sqlite3.Error, ConflictError):
+            # the caller may have edited the cached object itself, don't hand it out again
+            self.cache_drop('booking', [record.rid])
+            raise
+        if conflicts:
+            self.cache_drop('booking', [record.rid])
+            return conflicts
+        if not self.write_behind:
+            self.cache_put('booking', record)
+        return []
+
+    def get_buffered_conflicts(self, record):
+        # get_booking_conflicts, with the buffered bookings in place of what the db has for them
+        if not record.check_in:
+            return []
+        buffered = [other for table, other in self.pending.values() if table == 'booking' and other is not record]
+        held = {other.rid for other in buffered if other.rid != 0}
+        # the class's own method, the instance's one would flush the buffer before reading
+        found = SQLStorage.get_overlapping_bookings(self, record.check_in, record.check_out, record.room)
+        return [booking for booking in found if booking.rid != record.rid and booking.rid not in held] + \
+            [other for other in buffered if other.room == record.room and other.check_in
+             and (other.rid == 0 or other.rid != record.rid)
+             and other.check_in < record.check_out and record.check_in < other.check_out]
+
+    def get_booking_conflicts(self, record):
+        # the other bookings for the same room that share a night with this one
+        if not record.check_in:
+            return []
+        return [booking for booking in self.get_overlapping_bookings(record.check_in, record.check_out, record.room)
+                if booking.rid != record.rid]
+
+    def get_overlapping_bookings(self, check_in, check_out, room=None):
+        ''' hotel booking records staying any of the nights from check_in up to
+            check_out, optionally only the ones for one room. the r*tree of
+            booked nights finds them without looking at bookings on other dates
+        '''
+        check_in, check_out = check_stay(check_in, check_out)
+        where, params = "", [check_out, check_in]
+        if room is not None:
+            where, params = "AND b.room = ?", [check_out, check_in, room]
+        reader = self.readers['booking']
+        # CROSS JOIN keeps sqlite from walking every booking for the room and probing the r*tree with each
+        reader.execute(f"""SELECT b.* from booking_nights n CROSS JOIN booking b ON b.booking_id = n.id
+                WHERE n.first_night <= CAST(julianday(?) AS INTEGER) - 1
+                AND n.last_night >= CAST(julianday(?) AS INTEGER) {where}
+                ORDER BY b.check_in, b.booking_id;""", params)
+        return reader.fetchall()
+
+    def get_free_rooms(self, check_in, check_out):
+        ''' every room that has been booked before and has no booking on any
+            night from check_in up to check_out, in room number order
+        '''
+        check_in, check_out = check_stay(check_in, check_out)
+        self.data_access.execute("""SELECT room FROM rooms WHERE room NOT IN (
+                SELECT b.room FROM booking_nights n CROSS JOIN booking b ON b.booking_id = n.id
+                WHERE n.first_night <= CAST(julianday(?) AS INTEGER) - 1
+                AND n.last_night >= CAST(julianday(?) AS INTEGER))
+                ORDER BY CAST(room AS INTEGER), room;""", (check_out, check_in))
+        return [room for room, in self.data_access]
+
+    def save_records_booking(self, records):
+        ''' save many hotel booking records with a single commit
+            new records still get their rid filled in like save_record_booking
+            edits overwrite whatever is there, there is no conflict check
+        '''
+        old = [record for record in records if record.rid != 0]
+        with self.conn:     # one transaction, rolled back if anything fails
+            for record in records:
+                if record.rid == 0:     # inserts go one at a time so each one gets its lastrowid
+                    self.data_access.execute("""INSERT INTO booking(room, guests, name, email, check_in, check_out)
+                    VALUES (?,?,?,?,?,?)""", (record.room, record.guests, record.name, record.email,
+                                              record.check_in or None, record.check_out or None))
+                    record.rid = self.data_access.lastrowid
+            self.data_access.executemany("""UPDATE booking SET room = ?, guests = ?,name = ?, email = ?,
+            check_in = ?, check_out = ?, version = version + 1 WHERE booking_id = ?""",
+                                         [(record.room, record.guests, record.name, record.email,
+                                           record.check_in or None, record.check_out or None, record.rid)
+                                          for record in old])
+        for record in old:
+            record.version += 1
+        # only cache what was already cached, a big import shouldn't flush the hot records
+        for record in old:
+            if ('booking', record.rid) in self.cache:
+                self.cache_put('booking', record)
 
     def get_all_sorted_records_booking(self): # sorts the records for hotel booking
-        return sorted(self.get_all_records_booking(), key=lambda x: x.rid)
+        # sqlite walks the primary key in order so there is nothing left to sort
+        reader = self.readers['booking']
+        reader.execute("""SELECT * from booking ORDER BY booking_id;""")
+        return reader.fetchall()
+
+    def get_page_booking(self, limit=50, after_rid=None, after_value=None, order_by='booking_id', descending=False,
+                         filters=None, offset=0):
+        ''' keyset pagination for hotel booking: return the next `limit` records after
+            the last one of the previous page, given by its rid (and its order_by value
+            when not ordering by id). leave after_rid as None for the first page, or
+            to jump to offset. filters is {column: value}, see filter_clauses
+        '''
+        return self.keyset_rows('booking', 'booking_id', limit, after_rid, after_value, order_by, descending,
+                                filters, offset)
+
+    def count_records_booking(self, filters=None):
+        # number of hotel booking records (matching filters), used to size the browse scrollbar
+        where, params = self.filter_clauses('booking', filters)
+        self.data_access.execute(f"""SELECT COUNT(*) from booking {'WHERE ' + where if where else ''};""", params)
+        return self.data_access.fetchone()[0]
+
+    def get_records_by_ids_booking(self, rids):
+        # return the hotel booking records for a handful of ids, in no particular order
+        marks = ",".join("?" * len(rids))
+        reader = self.readers['booking']
+        reader.execute(f"""SELECT * from booking WHERE booking_id IN ({marks});""", tuple(rids))
+        return reader.fetchall()
+
+    def search_booking(self, text, limit=50, offset=0, after_rid=None):
+        ''' hotel booking records whose name or email has every word in text,
+            newest first (see search_query). after_rid seeks past the last
+            record of the previous page like get_page_booking
+        '''
+        return self.search_rows('booking', 'booking_id', text, limit, offset, after_rid)
+
+    def count_search_booking(self, text):
+        # number of hotel booking records search_booking would return in total
+        return self.search_count('booking', text)
 
     def delete_record_booking(self, rid):
         # delete record for hotel booking
@@ -56,20 +454,279 @@ class SQLStorage():
         self.data_access.execute("""DELETE FROM booking WHERE booking_id = ?""",
                                  (int(rid),))
         self.conn.commit()
+        self.cache_drop('booking', [rid])
+
+    def delete_records_booking(self, rids):
+        # delete many hotel booking records with a single commit
+        with self.conn:
+            self.data_access.executemany("""DELETE FROM booking WHERE booking_id = ?""",
+                                         [(int(rid),) for rid in rids])
+        self.cache_drop('booking', rids)
+
+    def update_records_booking(self, rids, changes, check=True):
+        ''' set the same values on many hotel booking records in one transaction.
+            changes maps column names from BULK_COLUMNS to the new value, the
+            other columns are left alone. with check on, moving bookings to a
+            room where they share a night with another booking saves nothing
+            and returns the clashing bookings, else returns an empty list
+        '''
+        return self.update_records('booking', 'booking_id', rids, changes,
+                                   check and 'room' in changes and self.get_room_conflicts)
+
+    def get_room_conflicts(self, rids):
+        # every booking sharing a night with one of these in the same room, these included
+        marks = ",".join("?" * len(rids))
+        reader = self.readers['booking']
+        reader.execute(f"""SELECT DISTINCT b.* from booking u
+                CROSS JOIN booking_nights un ON un.id = u.booking_id
+                CROSS JOIN booking_nights n ON n.first_night <= un.last_night AND n.last_night >= un.first_night
+                    AND n.id != u.booking_id
+                CROSS JOIN booking b ON b.booking_id = n.id AND b.room = u.room
+                WHERE u.booking_id IN ({marks})
+                ORDER BY b.check_in, b.booking_id;""", tuple(rids))
+        return reader.fetchall()
     
+    def search_inventory(self, text, limit=50, offset=0, after_rid=None):
+        ''' inventory records whose item name has every word in text,
+            newest first
+        '''
+        return self.search_rows('items', 'item_id', text, limit, offset, after_rid)
+
+    def count_search_inventory(self, text):
+        # number of inventory records search_inventory would return in total
+        return self.search_count('items', text)
+
+    # inventory totals, kept up to date by triggers (see init_db.create_stock_totals)
+    # so each of these reads a handful of rows however big the inventory is
+    def get_stock_total(self):
+        # (total quantity, number of records) over the whole inventory
+        self.data_access.execute("""SELECT quantity, records FROM stock_total WHERE id = 1;""")
+        return self.data_access.fetchone() or (0, 0)
+
+    def get_item_total(self, item):
+        # (total quantity, number of records) for one item name
+        self.data_access.execute("""SELECT quantity, records FROM item_totals WHERE item = ?;""", (item,))
+        return self.data_access.fetchone() or (0, 0)
+
+    def get_item_totals(self, limit=100, lowest_first=False):
+        ''' (item, total quantity, number of records) per item name, alphabetical
+            or lowest total first
+        '''
+        order = "quantity, item" if lowest_first else "item"
+        self.data_access.execute(f"""SELECT item, quantity, records FROM item_totals ORDER BY {order} LIMIT ?;""",
+                                 (limit,))
+        return self.data_access.fetchall()
+
+    def get_low_stock(self, threshold=None, limit=100):
+        # (item, total quantity) for items at or below threshold, lowest first
+        threshold = self.LOW_STOCK if threshold is None else threshold
+        self.data_access.execute("""SELECT item, quantity FROM item_totals WHERE quantity <= ?
+                ORDER BY quantity, item LIMIT ?;""", (threshold, limit))
+        return self.data_access.fetchall()
+
     def delete_record_inventory(self, rid):
         # delete record for inventory
         # convert to int since value comes from treeview (str)
         self.data_access.execute("""DELETE FROM items WHERE item_id = ?""",
                                  (int(rid),))
         self.conn.commit()
+        self.cache_drop('items', [rid])
+
+    def delete_records_inventory(self, rids):
+        # delete many inventory records with a single commit
+        with self.conn:
+            self.data_access.executemany("""DELETE FROM items WHERE item_id = ?""",
+                                         [(int(rid),) for rid in rids])
+        self.cache_drop('items', rids)
+
+    def update_records_inventory(self, rids, changes):
+        ''' set the same values on many inventory records in one transaction,
+            works the same as update_records_booking
+        '''
+        return self.update_records('items', 'item_id', rids, changes)
+
+    def update_records(self, table, key, rids, changes, check=None):
+        ''' shared write behind update_records_*: one set based UPDATE per
+            BULK_CHUNK ids, all in one write transaction. check(rids) runs after
+            the update inside it, anything it returns rolls the update back.
+            every row's version is bumped so open edit forms see the change
+        '''
+        for column in changes:
+            if column not in self.BULK_COLUMNS[table]:
+                raise ValueError(f'cannot bulk edit {table}.{column}')
+        rids = [int(rid) for rid in rids]
+        if not rids or not changes:
+            return []
+        assignments = ", ".join(f"{column} = ?" for column in changes)
+        try:
+            with self.conn:
+                self.conn.execute("""BEGIN IMMEDIATE;""")
+                for start in range(0, len(rids), self.BULK_CHUNK):
+                    chunk = rids[start:start + self.BULK_CHUNK]
+                    self.data_access.execute(f"""UPDATE {table} SET {assignments}, version = version + 1
+                            WHERE {key} IN ({",".join("?" * len(chunk))});""", (*changes.values(), *chunk))
+                conflicts = check(rids) if check else []
+                if conflicts:
+                    self.conn.rollback()
+                    return conflicts
+        finally:
+            # whatever happened the cached copies may be out of date
+            self.cache_drop(table, rids)
+        return []
+
+    def keyset_rows(self, table, key, limit, after_rid, after_value, order_by, descending, filters=None, offset=0):
+        ''' shared query behind get_page_*. seeking past (value, id) instead of using
+            OFFSET means sqlite jumps straight to the spot in the index, so every
+            page costs the same no matter how deep it is. offset is only for
+            jumping somewhere without the row before it
+        '''
+        if order_by not in self.SORT_COLUMNS[table]:
+            raise ValueError(f'cannot order {table} by {order_by!r}')
+        direction, compare = ("DESC", "<") if descending else ("ASC", ">")
+        where, params = self.filter_clauses(table, filters)
+        clauses = [where] if where else []
+        if after_rid is not None:
+            offset = 0
+            if order_by == key:
+                clauses.append(f"{key} {compare} ?")
+                params.append(after_rid)
+            else:
+                # the id breaks ties between rows with the same value
+                clauses.append(f"({order_by}, {key}) {compare} (?, ?)")
+                params += [after_value, after_rid]
+        where = "WHERE " + " AND ".join(clauses) if clauses else ""
+        order = f"{key} {direction}" if order_by == key else f"{order_by} {direction}, {key} {direction}"
+        reader = self.readers[table]
+        reader.execute(f"""SELECT * from {table} {where} ORDER BY {order} LIMIT ? OFFSET ?;""",
+                       params + [limit, offset])
+        return reader.fetchall()
+
+    def suggest(self, table, column, prefix, limit=None):
+        ''' up to limit distinct values of column starting with prefix, ignoring
+            case, in alphabetical order. for the entry field autocomplete.
+            each value is one seek into the column's nocase index to the first
+            entry past the one before, so repeats of a name cost nothing and
+            a lookup is the same few ms however big the table is
+        '''
+        if column not in init_db.SUGGEST_COLUMNS.get(table, ()):
+            raise ValueError(f'no suggestions for {table}.{column}')
+        prefix = prefix.strip()
+        if not prefix:
+            return []
+        self.data_access.execute(f"""
+            WITH RECURSIVE found(value) AS (
+                SELECT (SELECT {column} from {table} WHERE {column} COLLATE NOCASE >= ?1
+                        AND {column} COLLATE NOCASE < ?2 ORDER BY {column} COLLATE NOCASE LIMIT 1)
+                UNION ALL
+                SELECT (SELECT {column} from {table} WHERE {column} COLLATE NOCASE > found.value
+                        AND {column} COLLATE NOCASE < ?2 ORDER BY {column} COLLATE NOCASE LIMIT 1)
+                from found WHERE found.value IS NOT NULL
+            )
+            SELECT value from found WHERE value IS NOT NULL LIMIT ?3;""",
+            (prefix, prefix + "\U0010ffff", self.SUGGEST_LIMIT if limit is None else limit))
+        return [row[0] for row in self.data_access.fetchall()]
+
+    def filter_clauses(self, table, filters):
+        ''' turn {column: value} into sql conditions and their parameters. number
+            columns must equal the value, text columns must start with it (case
+            matters). both are written as ranges on the column so its index is used
+        '''
+        clauses, params = [], []
+        for column, value in (filters or {}).items():
+            if column not in self.SORT_COLUMNS[table]:
+                raise ValueError(f'cannot filter {table} by {column!r}')
+            value = str(value).strip()
+            if column in self.NUMBER_COLUMNS:
+                if not value.isdigit():
+                    raise ValueError(f'{column} filter must be a whole number, got {value!r}')
+                clauses.append(f"{column} = ?")
+                params.append(int(value))
+            else:
+                # everything that starts with value sorts between it and it followed by the highest character
+                clauses.append(f"{column} >= ? AND {column} < ?")
+                params += [value, value + "\U0010ffff"]
+        return " AND ".join(clauses), params
+
+    def search_rows(self, table, key, text, limit, offset, after_rid):
+        ''' shared query behind search_*. fts5 hands matches back in rowid order
+            so the page is cut from the index before any real rows are read
+        '''
+        query = search_query(text)
+        if query is None:
+            return []
+        where, params = "", [query]
+        if after_rid is not None:
+            where, params = "AND rowid < ?", [query, after_rid]
+        reader = self.readers[table]
+        reader.execute(f"""SELECT * from {table} WHERE {key} IN (
+                SELECT rowid FROM {table}_search WHERE {table}_search MATCH ? {where}
+                ORDER BY rowid DESC LIMIT ? OFFSET ?) ORDER BY {key} DESC;""", params + [limit, offset])
+        return reader.fetchall()
+
+    def search_count(self, table, text):
+        query = search_query(text)
+        if query is None:
+            return 0
+        self.data_access.execute(f"""SELECT COUNT(*) FROM {table}_search WHERE {table}_search MATCH ?;""",
+                                 (query,))
+        return self.data_access.fetchone()[0]
+
+    def iter_records(self, table, batch_size):
+        # a cursor of its own so other queries can run while the caller is still iterating
+        cursor = self.conn.cursor()
+        cursor.row_factory = self.readers[table].row_factory
+        try:
+            cursor.execute(f"""SELECT * from {table} ORDER BY rowid;""")
+            while True:
+                records = cursor.fetchmany(batch_size)
+                if not records:
+                    break
+                yield from records
+        finally:
+            cursor.close()
+
+    def write_browse_snapshot(self, path=None):
+        ''' save the newest SNAPSHOT_ROWS rows of each table as the browse page
+            shows them, with the row counts and the change log version, so the
+            next start can show them before the db is open. see browse_snapshot
+        '''
+        tables = {}
+        for table, columns in self.BROWSE_COLUMNS.items():
+            self.data_access.execute(f"""SELECT {', '.join(columns)} from {table}
+                                         ORDER BY {columns[0]} DESC LIMIT ?;""", (self.SNAPSHOT_ROWS,))
+            rows = self.data_access.fetchall()
+            self.data_access.execute(f"""SELECT COUNT(*) from {table};""")
+            tables[table] = (self.data_access.fetchone()[0], rows)
+        browse_snapshot.write(path or snapshot_path(self.filename), self.get_change_version(), tables)
 
     def cleanup(self):
         ''' call this before the app closes to ensure data integrity
+            anything still in the write-behind buffer is written first, a
+            locked db gets CLOSE_FLUSH_TRIES goes at it. what still can't be
+            written is reported in the error raised, not closed over quietly
         '''
         if (self.data_access):
-            self.conn.commit()
-            self.data_access.close()
+            try:
+                refused = locked = None
+                for _ in range(self.CLOSE_FLUSH_TRIES):
+                    try:
+                        self.flush()
+                    except sqlite3.OperationalError as e:
+                        locked = e
+                    except (sqlite3.Error, ConflictError) as e:
+                        refused = refused or e
+                    if not self.pending:
+                        break
+                if self.pending:
+                    raise sqlite3.OperationalError(f'{len(self.pending)} saves in the write-behind buffer '
+                                                   f'could not be written: {locked or refused}')
+                if refused is not None:
+                    raise refused
+                if self.browse_snapshot:
+                    self.write_browse_snapshot()
+            finally:
+                self.conn.commit()
+                self.data_access.close()
 
 
 
@@ -78,37 +735,103 @@ class SQLStorage():
         ''' return a single record identified by the record id
             takes the data from the columns in the inventory database
         '''
-        self.data_access.execute(
-            """SELECT * from items WHERE item_id= ?;""", (rid,))
-        row = self.data_access.fetchone()
-        items = Inventory(row[1], row[2], row[0])
-        return items
+        record = self.cache_get('items', rid)
+        if record is None:
+            reader = self.readers['items']
+            reader.execute(
+                """SELECT * from items WHERE item_id= ?;""", (rid,))
+            record = reader.fetchone()
+            if record is not None:
+                self.cache_put('items', record)
+        return record
 
     def get_all_records_inventory(self):
         ''' return all records stored in the inventory database
         '''
-        self.data_access.execute("""SELECT * from items;""")
-        items = []      # adds all of the records in a list
-        for row in self.data_access:
-            items.append(
-                Inventory(row[1], row[2], row[0]))
-        return items
+        return list(self.iter_records_inventory())
+
+    def iter_records_inventory(self, batch_size=1000):
+        ''' lazily yield every inventory record, batch_size rows at a time
+        '''
+        yield from self.iter_records('items', batch_size)
     
     def save_record_inventory(self, record):
         ''' add a record represented by a dict with a new id
             saves new records and edited records for the inventory
+            an edit raises ConflictError if the row changed since the record was read
         '''
+        if self.write_behind:
+            self.buffer_record('items', record)
+            return
+        try:
+            with self.conn:     # rolled back if the row breaks a constraint, e.g. quantity not a number
+                self.write_inventory(record)
+        except (sqlite3.Error, ConflictError):
+            # the caller may have edited the cached object itself, don't hand it out again
+            self.cache_drop('items', [record.rid])
+            raise
+        self.cache_put('items', record)     # write through so the next get is free
+
+    def write_inventory(self, record):
+        # the insert or update behind save_record_inventory, the caller commits
         if record.rid == 0:     # if new record
             self.data_access.execute("""INSERT INTO items(item, quantity) VALUES (?,?)
             """, (record.item, record.quantity))
             record.rid = self.data_access.lastrowid
         else:   # if old record/ updating record
-            self.data_access.execute("""UPDATE items SET item = ?, quantity = ?
-            WHERE item_id = ?""", (record.item, record.quantity, record.rid))
-        self.conn.commit()
+            # only if nobody else saved it since we read it
+            self.data_access.execute("""UPDATE items SET item = ?, quantity = ?, version = version + 1
+            WHERE item_id = ? AND version = ?""", (record.item, record.quantity, record.rid, record.version))
+            if self.data_access.rowcount == 0:
+                raise ConflictError(f'inventory item {record.rid} was changed or deleted by someone else')
+            record.version += 1
+
+    def save_records_inventory(self, records):
+        ''' save many inventory records with a single commit
+            new records still get their rid filled in like save_record_inventory
+            edits overwrite whatever is there, there is no conflict check
+        '''
+        old = [record for record in records if record.rid != 0]
+        with self.conn:     # one transaction, rolled back if anything fails
+            for record in records:
+                if record.rid == 0:     # inserts go one at a time so each one gets its lastrowid
+                    self.data_access.execute("""INSERT INTO items(item, quantity) VALUES (?,?)
+                    """, (record.item, record.quantity))
+                    record.rid = self.data_access.lastrowid
+            self.data_access.executemany("""UPDATE items SET item = ?, quantity = ?, version = version + 1
+            WHERE item_id = ?""", [(record.item, record.quantity, record.rid) for record in old])
+        for record in old:
+            record.version += 1
+        # only cache what was already cached, a big import shouldn't flush the hot records
+        for record in old:
+            if ('items', record.rid) in self.cache:
+                self.cache_put('items', record)
 
     def get_all_sorted_records_inventory(self): # sorts all inventory records
-        return sorted(self.get_all_records_inventory(), key=lambda x: x.rid)
+        # sqlite walks the primary key in order so there is nothing left to sort
+        reader = self.readers['items']
+        reader.execute("""SELECT * from items ORDER BY item_id;""")
+        return reader.fetchall()
+
+    def get_page_inventory(self, limit=50, after_rid=None, after_value=None, order_by='item_id', descending=False,
+                           filters=None, offset=0):
+        ''' keyset pagination for inventory, works the same as get_page_booking
+        '''
+        return self.keyset_rows('items', 'item_id', limit, after_rid, after_value, order_by, descending,
+                                filters, offset)
+
+    def count_records_inventory(self, filters=None):
+        # number of inventory records (matching filters), used to size the browse scrollbar
+        where, params = self.filter_clauses('items', filters)
+        self.data_access.execute(f"""SELECT COUNT(*) from items {'WHERE ' + where if where else ''};""", params)
+        return self.data_access.fetchone()[0]
+
+    def get_records_by_ids_inventory(self, rids):
+        # return the inventory records for a handful of ids, in no particular order
+        marks = ",".join("?" * len(rids))
+        reader = self.readers['items']
+        reader.execute(f"""SELECT * from items WHERE item_id IN ({marks});""", tuple(rids))
+        return reader.fetchall()
 
 
 
@@ -117,23 +840,34 @@ class ShelveStorage():
     which pickles objects into a dbm
     '''
     FILENAME = "project_data.db"
+    NEXT_ID_KEY = "next_id"     # doesn't start with "record" so it is never mistaken for one
+    WRITEBACK_SIZE = 100        # saved records held in memory before they are written out
 
-    def __init__(self):
+    def __init__(self, filename=None):
         ''' initiate access to the data persistence layer
         '''
-        # using writeback is slower but avoids some weird caching issues
-        self.data_access = shelve.open(self.FILENAME, writeback=True)
+        # writeback=True kept every object we ever touched in memory until close,
+        # instead saved records wait in a small write-back cache of our own
+        self.data_access = shelve.open(filename or self.FILENAME)
+        self.dirty = {}     # record key -> record not written to the shelf yet
+        # index of the record ids, built from the keys so nothing gets unpickled
+        self.ids = set(int(key[len("record"):]) for key in self.data_access.keys()
+                       if key.startswith("record"))
+        # the counter is saved with the records, the index covers a crash before it was
+        self.next_id = max(self.data_access.get(self.NEXT_ID_KEY, 1), max(self.ids, default=0) + 1)
 
     def get_record(self, rid):
         ''' return a single record identified by the record id
         '''
         record_id = "record" + str(rid)
+        if record_id in self.dirty:
+            return self.dirty[record_id]
         return self.data_access[record_id]
 
     def get_all_records(self):
         ''' return all records stored in the database
         '''
-        return list(self.data_access.values())
+        return [self.get_record(rid) for rid in self.ids]
 
     def save_record(self, record):
         ''' add a record represented by a dict with a new id
@@ -145,31 +879,67 @@ class ShelveStorage():
         record_key = "record" + str(record.rid)
 
         # needs to be an string key for the dict
-        self.data_access[record_key] = record
+        self.dirty[record_key] = record
+        self.ids.add(int(record.rid))
+        if len(self.dirty) >= self.WRITEBACK_SIZE:
+            self.flush()
 
     def get_all_sorted_records(self):
-        return sorted(self.get_all_records(), key=lambda x: x.rid)
+        # sort the ids from the index, not the unpickled records
+        return [self.get_record(rid) for rid in sorted(self.ids)]
 
     def delete_record(self, rid):
-        del self.data_access["record" + str(rid)]
+        record_key = "record" + str(rid)
+        # a record that was only ever in the write-back cache has nothing on the shelf to delete
+        if self.dirty.pop(record_key, None) is None or record_key in self.data_access:
+            del self.data_access[record_key]
+        self.ids.discard(int(rid))
 
     def get_new_id(self):
-        all_sorted_records = self.get_all_sorted_records()
-        if len(all_sorted_records) == 0:
-            return 1
-        else:
-            return int(self.get_all_sorted_records()[-1].rid) + 1
-# edge case if all are deleted after creation, what is the safe number?
+        # ids only ever go up, so one deleted after creation is never handed out again
+        rid = self.next_id
+        self.next_id += 1
+        return rid
+
+    def flush(self):
+        ''' write the cached records and the id counter out and sync the shelf
+        '''
+        for record_key, record in self.dirty.items():
+            self.data_access[record_key] = record
+        self.data_access[self.NEXT_ID_KEY] = self.next_id
+        self.dirty.clear()
+        self.data_access.sync()
 
     def cleanup(self):
         ''' call this before the app closes to ensure data integrity
         '''
+        self.flush()
         self.data_access.close()
 
 
-class Booking(): # everything that booking entries will have
-    def __init__(self, room ="", guests="", name="", email="", rid=0):
+class Record():
+    ''' base for the record types. __slots__ keeps each record down to a few
+        pointers instead of carrying its own __dict__
+    '''
+    __slots__ = ()
+
+    def __setstate__(self, state):
+        # shelve files written before the records had __slots__ pickled a plain dict
+        if isinstance(state, tuple):
+            state = state[1]
+        for key, value in state.items():
+            setattr(self, key, value)
+
+
+class Booking(Record): # everything that booking entries will have
+    __slots__ = ('rid', 'room', 'guests', 'name', 'email', 'version', 'check_in', 'check_out')
+
+    def __init__(self, room ="", guests="", name="", email="", rid=0, version=0, check_in=None, check_out=None):
         self.rid = rid  # 0 represents a new, unsaved record; will get updated
+        self.version = version  # bumped by every save, see SQLStorage.save_record_booking
+        # YYYY-MM-DD, both None for a booking without a stay
+        self.check_in = check_in
+        self.check_out = check_out
         self.room = room
         self.guests = guests
         self.name = name
@@ -178,11 +948,61 @@ class Booking(): # everything that booking entries will have
     def __str__(self):
         return f'Booking#: {self.rid}; Room: {self.room},Guests: {self.guests}, Name: {self.name}, Email: {self.email}'
 
-class Inventory(): # eevrything that inventory entries will have
-    def __init__(self, item ="", quantity="", rid=0):
+class Inventory(Record): # eevrything that inventory entries will have
+    __slots__ = ('rid', 'item', 'quantity', 'version')
+
+    def __init__(self, item ="", quantity="", rid=0, version=0):
         self.rid = rid  # 0 represents a new, unsaved record; will get updated
+        self.version = version  # bumped by every save, see SQLStorage.save_record_inventory
         self.item = item
         self.quantity = quantity
 
     def __str__(self):
         return f'Inventory#: {self.rid}; Item: {self.item},quantity: {self.quantity}'
+
+
+def check_stay(check_in, check_out):
+    ''' validate a pair of YYYY-MM-DD dates from a form or a file. returns
+        them tidied up, or (None, None) when both are blank. raises ValueError
+        when they aren't dates or check out isn't after check in
+    '''
+    check_in, check_out = (check_in or "").strip(), (check_out or "").strip()
+    if not check_in and not check_out:
+        return None, None
+    try:
+        first, last = date.fromisoformat(check_in), date.fromisoformat(check_out)
+    except ValueError:
+        raise ValueError(f'check in and check out must both be dates like 2024-12-31, '
+                         f'got {check_in!r} and {check_out!r}') from None
+    if last <= first:
+        raise ValueError('check out has to be after check in')
+    return first.isoformat(), last.isoformat()
+
+
+def snapshot_path(filename=None):
+    # where the browse snapshot of a db file lives
+    return (filename or SQLStorage.FILENAME) + '.browse'
+
+
+def search_query(text):
+    ''' turn what was typed into a search box into an fts5 query: every word
+        has to appear, and the last one may still be half typed so it only has
+        to start a word. whole words are much cheaper to look up than prefixes.
+        quotes keep punctuation like the @ in an email from being read as
+        syntax. returns None when there is nothing to search for
+    '''
+    words = [f'"{word}"' for word in text.replace('"', ' ').split()]
+    if not words:
+        return None
+    words[-1] += '*'
+    return ' '.join(words)
+
+
+# row factories for sqlite, rows come back as (id, columns...) in table order
+def booking_from_row(cursor, row):
+    return Booking(row[1], row[2], row[3], row[4], row[0], row[5], row[6], row[7])
+
+
+def inventory_from_row(cursor, row):
+    # the items table stores quantity before item
+    return Inventory(item=row[2], quantity=row[1], rid=row[0], version=row[3])
@@ -0,0 +1,7 @@
+import pytest
+
+
+@pytest.fixture
+def path(tmp_path):
+    # a db file of its own for each test
+    return str(tmp_path / 'test.db')
@@ -0,0 +1,13 @@
+''' cli.py: failures come out as one error line and exit code 1
+'''
+import cli
+
+
+def test_db_that_wont_open_is_an_error_line(tmp_path, capsys):
+    assert cli.main(['--db', str(tmp_path / 'missing' / 'x.db'), 'stats']) == 1
+    assert capsys.readouterr().err == 'error: unable to open database file\n'
+
+
+def test_missing_record_is_an_error_line(path, capsys):
+    assert cli.main(['--db', path, 'get', 'booking', '7']) == 1
+    assert capsys.readouterr().err == 'error: no booking record with id 7\n'
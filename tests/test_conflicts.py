@@ -0,0 +1,19 @@
+''' row versions: an edit saved over someone else's newer save is refused
+'''
+import pytest
+
+from models import SQLStorage, Booking, ConflictError
+
+
+def test_stale_edit_raises_conflict(path):
+    mine, theirs = SQLStorage(path, cache_size=0), SQLStorage(path, cache_size=0)
+    booking = Booking(room='1', guests=2, name='alice', email='a@example.com')
+    mine.save_record_booking(booking)
+    mine_copy, their_copy = mine.get_record_booking(booking.rid), theirs.get_record_booking(booking.rid)
+    their_copy.name = 'bob'
+    theirs.save_record_booking(their_copy)
+    mine_copy.name = 'carol'
+    with pytest.raises(ConflictError):
+        mine.save_record_booking(mine_copy)
+    assert mine.get_record_booking(booking.rid).name == 'bob'
+    assert mine.get_record_booking(booking.rid).version == 1
@@ -0,0 +1,130 @@
+''' schema upgrades: from the original tables, resumed after an interruption,
+    with another connection writing or migrating while the typed column rebuild
+    copies, and after cli.py repair has fixed the rows that stopped it
+'''
+import sqlite3
+
+import pytest
+
+import cli
+import init_db
+
+
+def old_db(path, bookings=7, guests='2'):
+    # a db as the first release made it, before any migration ran
+    c = sqlite3.connect(path)
+    init_db.create_tables(c, 0, None)
+    c.executemany('''INSERT INTO booking(room, guests, name, email) VALUES (?,?,?,?)''',
+                  [(str(i), guests, f'guest {i}', f'guest{i}@example.com') for i in range(1, bookings + 1)])
+    c.executemany('''INSERT INTO items(quantity, item) VALUES (?,?)''', [(' 3 ', 'towel'), ('4', 'soap')])
+    c.commit()
+    c.close()
+
+
+def test_upgrade_keeps_rows(tmp_path):
+    path = str(tmp_path / 'old.db')
+    old_db(path)
+    c = sqlite3.connect(path)
+    assert init_db.migrate(c) == len(init_db.MIGRATIONS)
+    assert c.execute('''SELECT booking_id, guests, typeof(guests) FROM booking WHERE booking_id = 1;''').fetchone() \
+        == (1, 2, 'integer')
+    assert c.execute('''SELECT quantity, item FROM items ORDER BY item_id;''').fetchall() == [(3, 'towel'), (4, 'soap')]
+    # running it again is a no-op
+    assert init_db.migrate(c) == len(init_db.MIGRATIONS)
+
+
+def test_current_db_opens_while_another_writes(tmp_path):
+    path = str(tmp_path / 'new.db')
+    c = sqlite3.connect(path)
+    init_db.migrate(c)
+    writer = sqlite3.connect(path)
+    writer.execute('''BEGIN IMMEDIATE;''')
+    # nothing to upgrade, so it mustn't wait for the writer's lock
+    reader = sqlite3.connect(path, timeout=0)
+    assert init_db.migrate(reader) == len(init_db.MIGRATIONS)
+    writer.rollback()
+
+
+def test_interrupted_rebuild_resumes(tmp_path):
+    path = str(tmp_path / 'old.db')
+    old_db(path, bookings=9)
+
+    def stop_after_first_batch(message):
+        if 'copied' in message:
+            raise KeyboardInterrupt
+
+    c = sqlite3.connect(path)
+    with pytest.raises(KeyboardInterrupt):
+        init_db.migrate(c, batch_size=2, progress=stop_after_first_batch)
+    assert c.execute('''PRAGMA user_version;''').fetchone()[0] == 2
+    assert c.execute('''SELECT COUNT(*) FROM booking_new;''').fetchone()[0] == 2
+
+    messages = []
+    init_db.migrate(c, batch_size=2, progress=messages.append)
+    assert '  booking: copied 2 rows after id 2' in messages    # carried on after the first batch
+    assert c.execute('''SELECT COUNT(*) FROM booking;''').fetchone()[0] == 9
+
+
+def test_writes_during_rebuild_are_kept(tmp_path):
+    path = str(tmp_path / 'old.db')
+    old_db(path)
+    other = sqlite3.connect(path, timeout=5)
+
+    def write_between_batches(message):
+        # another machine saving while the copy is half way through
+        if message == '  booking: copied 2 rows after id 2':
+            other.execute('''UPDATE booking SET name = 'edited' WHERE booking_id = 1;''')
+            other.execute('''DELETE FROM booking WHERE booking_id = 2;''')
+            other.execute('''INSERT INTO booking(room, guests, name, email) VALUES ('9', '1', 'late', 'x');''')
+            other.commit()
+
+    c = sqlite3.connect(path, timeout=5)
+    init_db.migrate(c, batch_size=2, progress=write_between_batches)
+    assert c.execute('''SELECT name FROM booking WHERE booking_id = 1;''').fetchone() == ('edited',)
+    assert c.execute('''SELECT COUNT(*) FROM booking WHERE booking_id = 2;''').fetchone() == (0,)
+    assert c.execute('''SELECT COUNT(*) FROM booking WHERE name = 'late';''').fetchone() == (1,)
+    assert c.execute('''SELECT COUNT(*) FROM booking;''').fetchone() == (7,)
+    assert c.execute('''SELECT name FROM sqlite_master WHERE name LIKE '%migrate%';''').fetchall() == []
+
+
+def test_two_migrators_at_once(tmp_path):
+    path = str(tmp_path / 'old.db')
+    old_db(path, bookings=9)
+    other = sqlite3.connect(path, timeout=5)
+    finished = []
+
+    def second_app_opens(message):
+        # another machine opens the db while this one is between batches and finishes the upgrade
+        if message == '  booking: copied 2 rows after id 0' and not finished:
+            finished.append(init_db.migrate(other, batch_size=2))
+
+    c = sqlite3.connect(path, timeout=5)
+    assert init_db.migrate(c, batch_size=2, progress=second_app_opens) == len(init_db.MIGRATIONS)
+    assert finished == [len(init_db.MIGRATIONS)]
+    assert c.execute('''PRAGMA user_version;''').fetchone()[0] == len(init_db.MIGRATIONS)
+    assert c.execute('''SELECT COUNT(*), SUM(guests) FROM booking;''').fetchone() == (9, 18)
+    assert c.execute('''SELECT name FROM sqlite_master WHERE name LIKE '%\\_new' ESCAPE '\\';''').fetchall() == []
+
+
+@pytest.mark.parametrize('guests', ['two', '-1', '2.5'])
+def test_bad_numbers_stop_the_upgrade(tmp_path, guests):
+    path = str(tmp_path / 'old.db')
+    old_db(path, bookings=2, guests=guests)
+    c = sqlite3.connect(path)
+    with pytest.raises(ValueError, match='whole number'):
+        init_db.migrate(c)
+    assert not c.in_transaction
+    assert c.execute('''PRAGMA user_version;''').fetchone()[0] == 2
+    assert c.execute('''SELECT guests FROM booking;''').fetchall() == [(guests,), (guests,)]
+
+
+def test_repair_lets_the_upgrade_through(tmp_path, capsys):
+    path = str(tmp_path / 'old.db')
+    old_db(path, bookings=2, guests='2 adults')
+    assert cli.main(['--db', path, 'repair']) == 0
+    assert capsys.readouterr().out.splitlines() == ['booking\t1\tguests\t2 adults', 'booking\t2\tguests\t2 adults']
+    assert cli.main(['--db', path, 'repair', '--leading']) == 0
+    assert capsys.readouterr().out == ''
+    c = sqlite3.connect(path)
+    assert init_db.migrate(c) == len(init_db.MIGRATIONS)
+    assert c.execute('''SELECT guests FROM booking;''').fetchall() == [(2,), (2,)]
@@ -0,0 +1,58 @@
+''' stays: checked booking saves, in both the direct and the write-behind mode,
+    and the same double booking check on imports
+'''
+import pytest
+
+import bulk_io
+from models import SQLStorage, Booking
+
+
+def test_failed_save_is_dropped_from_cache(path):
+    storage = SQLStorage(path)
+    booking = Booking(room='1', guests=2, name='alice', email='a@example.com', check_in='2030-01-01',
+                      check_out='2030-01-03')
+    storage.save_record_booking(booking)
+    cached = storage.get_record_booking(booking.rid)
+    cached.name, cached.check_in = 'unsaved', 'not a date'
+    with pytest.raises(ValueError):
+        storage.save_record_booking_checked(cached)
+    assert storage.get_record_booking(booking.rid).name == 'alice'
+
+
+def test_write_behind_checked_booking_sees_buffer(path):
+    storage = SQLStorage(path, write_behind=True)
+    first = Booking(room='1', guests=1, name='a', email='a', check_in='2030-01-01', check_out='2030-01-03')
+    second = Booking(room='1', guests=1, name='b', email='b', check_in='2030-01-02', check_out='2030-01-04')
+    assert storage.save_record_booking_checked(first) == []
+    assert storage.save_record_booking_checked(second) == [first]
+    assert len(storage.pending) == 1     # checked without flushing the first one
+    storage.flush()
+    assert storage.count_records_booking() == 1
+
+
+def test_import_rejects_double_bookings(path, tmp_path):
+    storage = SQLStorage(path)
+    storage.save_record_booking(Booking(room='1', guests=1, name='a', email='a', check_in='2030-01-01',
+                                        check_out='2030-01-05'))
+    rows = tmp_path / 'rows.csv'
+    rows.write_text('room,guests,name,email,check_in,check_out\n'
+                    '1,1,b,b,2030-01-04,2030-01-06\n'     # overlaps the one in the db
+                    '1,1,c,c,2030-01-05,2030-01-07\n'     # starts the day that one leaves
+                    '1,1,d,d,2030-01-06,2030-01-08\n'     # overlaps c, earlier in the file
+                    '2,1,e,e,2030-01-06,2030-01-08\n'
+                    '1,1,f,f,,\n')
+    report = bulk_io.import_file(storage, 'booking', str(rows))
+    assert (report['imported'], report['rejected']) == (3, 2)
+    assert [line_no for line_no, error in report['errors']] == [2, 4]
+    assert 'earlier row: 2030-01-05 to 2030-01-07' in report['errors'][1][1]
+
+
+def test_import_of_an_export_into_the_same_db(path, tmp_path):
+    storage = SQLStorage(path)
+    for room in '123':
+        storage.save_record_booking(Booking(room=room, guests=1, name='a', email='a', check_in='2030-01-01',
+                                            check_out='2030-01-05'))
+    bulk_io.export_file(storage, 'booking', str(tmp_path / 'out.jsonl'))
+    report = bulk_io.import_file(storage, 'booking', str(tmp_path / 'out.jsonl'))
+    assert (report['imported'], report['rejected']) == (0, 3)
+    assert storage.count_records_booking() == 3
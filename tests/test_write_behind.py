@@ -0,0 +1,92 @@
+''' the write-behind buffer: saves grouped into one transaction, and what
+    happens to the group when one of them fails
+'''
+import sqlite3
+
+import pytest
+
+from models import SQLStorage, Inventory
+
+
+def test_write_behind_groups_saves(path):
+    storage = SQLStorage(path, write_behind=True)
+    commits = []
+    storage.conn.set_trace_callback(lambda sql: sql.startswith('COMMIT') and commits.append(sql))
+    records = [Inventory(item=f'item {i}', quantity=i) for i in range(5)]
+    for record in records:
+        storage.save_record_inventory(record)
+    assert storage.count_records_inventory() == 5     # any other call flushes first
+    assert len(commits) == 1
+    assert [record.rid for record in records] == [1, 2, 3, 4, 5]
+
+
+def test_write_behind_bad_record_rolls_back_alone(path):
+    storage = SQLStorage(path, write_behind=True)
+    good, bad, after = (Inventory(item='soap', quantity=1), Inventory(item='towel', quantity=-1),
+                        Inventory(item='mug', quantity=2))
+    for record in (good, bad, after):
+        storage.save_record_inventory(record)
+    with pytest.raises(sqlite3.IntegrityError):
+        storage.flush()
+    assert bad.rid == 0     # the id the rolled back batch gave it was handed back
+    assert sorted(record.item for record in storage.get_all_records_inventory()) == ['mug', 'soap']
+
+
+def test_write_behind_transient_failure_retries(path):
+    storage = SQLStorage(path, write_behind=True)
+    record = Inventory(item='soap', quantity=1)
+    storage.save_record_inventory(record)
+    write, calls = storage.write_inventory, []
+
+    def locked_once(record):
+        calls.append(record)
+        if len(calls) == 1:
+            raise sqlite3.OperationalError('database is locked')
+        write(record)
+
+    storage.write_inventory = locked_once
+    storage.flush()     # the retry saved it, nothing to raise
+    assert record.rid == 1
+    assert storage.get_record_inventory(1).item == 'soap'
+
+
+def locked(calls):
+    # a writer that fails the first calls writes with a locked db, then saves normally
+    def write(record, real):
+        if calls:
+            calls.pop()
+            raise sqlite3.OperationalError('database is locked')
+        real(record)
+    return write
+
+
+def test_write_behind_locked_db_keeps_the_record(path):
+    storage = SQLStorage(path, write_behind=True)
+    record = Inventory(item='soap', quantity=1)
+    storage.save_record_inventory(record)
+    write, calls = storage.write_inventory, ['batch', 'retry']
+    storage.write_inventory = lambda record: locked(calls)(record, write)
+    with pytest.raises(sqlite3.OperationalError):
+        storage.flush()
+    assert record.rid == 0
+    assert list(storage.pending.values()) == [('items', record)]    # still buffered, not lost
+    storage.flush()
+    assert storage.get_record_inventory(record.rid).item == 'soap'
+
+
+def test_cleanup_retries_a_locked_db(path):
+    storage = SQLStorage(path, write_behind=True)
+    storage.save_record_inventory(Inventory(item='soap', quantity=1))
+    write, calls = storage.write_inventory, ['batch', 'retry']
+    storage.write_inventory = lambda record: locked(calls)(record, write)
+    storage.cleanup()
+    assert SQLStorage(path).count_records_inventory() == 1
+
+
+def test_cleanup_reports_what_it_could_not_write(path):
+    storage = SQLStorage(path, write_behind=True)
+    storage.save_record_inventory(Inventory(item='soap', quantity=1))
+    write, calls = storage.write_inventory, ['locked'] * 2 * SQLStorage.CLOSE_FLUSH_TRIES
+    storage.write_inventory = lambda record: locked(calls)(record, write)
+    with pytest.raises(sqlite3.OperationalError, match='1 saves in the write-behind buffer'):
+        storage.cleanup()
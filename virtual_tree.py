@@ -0,0 +1,283 @@
+import tkinter as tk
+import tkinter.ttk as ttk
+
+
+class VirtualTreeview(tk.Frame):
+    ''' a treeview that only ever holds the rows around the visible window.
+        rows are pulled from the database a page at a time as the scrollbar
+        moves, and pages that scroll far out of view are dropped again.
+        all the loading happens on the db worker so scrolling never blocks.
+        the selection is kept as record ids, apart from the rows on screen, so
+        it survives scrolling and can take in rows that were never loaded:
+        shift click selects every row between two clicks and select_all every
+        row of the current source
+    '''
+    SELECT_PAGE = 1000      # rows per fetch when a range or select all is turned into ids
+    def __init__(self, parent, columns, executor, count, fetch, fetch_ids=None, height=10, page_size=100,
+                 keep_pages=2, *args, **kwargs):
+        # same as EntryField, args and kwargs only apply to the outer frame
+        super().__init__(parent, *args, **kwargs)
+        # these three run on the worker thread and get the storage as their first argument
+        # count(storage) returns the number of rows, fetch(storage, offset, limit, after) returns a list
+        # of value tuples (after is the last row of the page before when we have it, so the db can
+        # seek past it) and fetch_ids(storage, rids) returns the value tuples for just those ids
+        self.executor = executor
+        self.count = count
+        self.fetch = fetch
+        self.fetch_ids = fetch_ids
+        self.height = height
+        self.page_size = page_size
+        self.keep_pages = keep_pages    # pages kept on either side of the window
+        self.total = 0
+        self.offset = 0     # index of the first visible row
+        self.pages = {}     # page number -> list of row values
+        self.generation = 0     # bumped on refresh so pages loaded before it get thrown away
+        self.recount = False    # a new row count has been asked for but hasn't arrived
+        self.selected = set()   # ids of the selected rows, on screen or not
+        self.anchor = None      # index of the row a shift click selects from
+        self.source = 0         # bumped by set_source so ids collected for an older source get thrown away
+
+        self.scrollbarx = tk.Scrollbar(self, orient=tk.HORIZONTAL)
+        # the vertical scrollbar is driven by us, not by the treeview
+        self.scrollbary = tk.Scrollbar(self, orient=tk.VERTICAL, command=self.yview)
+        self.tree = ttk.Treeview(self, columns=columns, height=height, selectmode="extended",
+                                 xscrollcommand=self.scrollbarx.set)
+        self.scrollbarx.config(command=self.tree.xview)
+        self.scrollbary.pack(side=tk.RIGHT, fill=tk.Y)
+        self.scrollbarx.pack(side=tk.BOTTOM, fill=tk.X)
+        self.tree.pack()
+        # the treeview only holds one window of rows so it can't scroll by itself
+        self.tree.bind('<MouseWheel>', self.on_wheel)
+        self.tree.bind('<Button-4>', lambda event: self.scroll(-3))
+        self.tree.bind('<Button-5>', lambda event: self.scroll(3))
+        # the treeview only knows about the rows on screen, self.selected is the real selection
+        self.tree.bind('<ButtonPress-1>', self.on_click)
+        self.tree.bind('<<TreeviewSelect>>', self.on_select)
+        self.tree.bind('<Control-a>', lambda event: self.select_all() or "break")
+
+    def refresh(self):
+        ''' drop every cached page and reload the visible window from the db
+        '''
+        self.generation += 1
+        self.pages = {}
+        self.recount = True
+        self.request_window()
+
+    def preload(self, total, rows):
+        ''' show rows saved by an earlier run (see browse_snapshot) as the first
+            page until the db has been checked, without asking the worker
+        '''
+        self.total = total
+        self.pages = {0: list(rows[:self.page_size])}
+        self.recount = False
+        self.offset = 0
+        self.render()
+
+    def set_source(self, count, fetch, fetch_ids=None):
+        ''' show a different set of rows, e.g. search results, starting from the top.
+            takes the same functions as the constructor
+        '''
+        self.count = count
+        self.fetch = fetch
+        self.fetch_ids = fetch_ids
+        self.offset = 0
+        # what was selected may not be in the new rows at all
+        self.source += 1
+        self.selected = set()
+        self.anchor = None
+        self.refresh()
+
+    def request_window(self):
+        ''' ask the worker for whatever the current window is missing
+        '''
+        first = self.offset // self.page_size
+        last = (self.offset + self.height - 1) // self.page_size
+        missing = [page for page in range(first, last + 1) if page not in self.pages]
+        if not missing and not self.recount:
+            self.render()
+            return
+        afters = {}
+        for page in missing:
+            before = self.pages.get(page - 1)
+            if before and len(before) == self.page_size:
+                afters[page] = before[-1]
+        # while scrolling quickly only the newest window is worth loading
+        self.executor.submit(self.load_window, self.generation, self.count, self.fetch, missing, afters,
+                             self.recount, callback=self.on_window, key=('window', id(self)))
+
+    def load_window(self, storage, generation, count, fetch, missing, afters, recount):
+        # runs on the worker thread, so it only uses what it was handed
+        total = count(storage) if recount else None
+        pages = {page: fetch(storage, page * self.page_size, self.page_size, afters.get(page))
+                 for page in missing}
+        return generation, total, pages
+
+    def on_window(self, result):
+        generation, total, pages = result
+        if generation != self.generation:
+            return  # a refresh happened while this was loading, its own request is already queued
+        if total is not None:
+            self.total = total
+            self.recount = False
+        self.pages.update(pages)
+        self.scroll_to(self.offset, force=True)
+
+    def held_ids(self):
+        # the ids of every row in the cached pages, taken on the tk thread for collect_changes
+        return frozenset(values[0] for rows in self.pages.values() for values in rows)
+
+    def collect_changes(self, storage, changes, held):
+        ''' runs on the worker thread: for a batch of {rid: op} changes return the
+            row count and fresh values for the edited rows among held (see
+            held_ids), or None when the window will have to be reloaded anyway.
+            however many rows were edited only the ones we hold are read
+        '''
+        if not changes or self.fetch_ids is None or any(op != 'update' for op in changes.values()):
+            return None
+        return self.count(storage), self.fetch_ids(storage, [rid for rid in changes if rid in held])
+
+    def apply_changes(self, changes, collected):
+        ''' patch the rows we are holding with {rid: op} deltas from the change
+            feed instead of reloading them. edits only cost the changed rows,
+            but inserts and deletes shift every row after them so the window
+            is reloaded
+        '''
+        if not changes:
+            return
+        self.selected -= {rid for rid, op in changes.items() if op == 'delete'}
+        # an insert that was edited afterwards only shows up as an update,
+        # but it still changes the row count
+        if collected is None or collected[0] != self.total:
+            self.refresh()
+            return
+        held = {}   # rid -> (page, position) for the changed rows we have cached
+        for page, rows in self.pages.items():
+            for position, values in enumerate(rows):
+                if values[0] in changes:
+                    held[values[0]] = (page, position)
+        for values in collected[1]:
+            if values[0] not in held:
+                continue
+            page, position = held[values[0]]
+            self.pages[page][position] = values
+            if self.tree.exists(str(values[0])):
+                self.tree.item(str(values[0]), values=values)
+
+    def render(self):
+        ''' replace the treeview rows with the rows in the current window
+        '''
+        self.tree.delete(*self.tree.get_children())
+        for index in range(self.offset, min(self.offset + self.height, self.total)):
+            page, position = divmod(index, self.page_size)
+            rows = self.pages.get(page)
+            if rows is None or position >= len(rows):
+                break   # the table shrank since we counted it
+            values = rows[position]
+            # the record id doubles as the treeview item id
+            iid = str(values[0])
+            if not self.tree.exists(iid):   # rows can shift between two page fetches
+                self.tree.insert("", tk.END, iid=iid, values=values)
+        self.show_selection()
+        self.evict()
+        self.update_scrollbar()
+
+    def show_selection(self):
+        # highlight the selected rows that are on screen
+        self.tree.selection_set([iid for iid in self.tree.get_children() if int(iid) in self.selected])
+
+    def on_select(self, event):
+        # the rows on screen are selected as the treeview has them, the rest stay as they were
+        shown = {int(iid) for iid in self.tree.get_children()}
+        self.selected = (self.selected - shown) | {int(iid) for iid in self.tree.selection()}
+
+    def on_click(self, event):
+        ''' a plain click starts a new selection, off screen rows included,
+            control click adds to it and shift click selects every row from
+            the last click to this one, loaded or not
+        '''
+        iid = self.tree.identify_row(event.y)
+        if not iid or self.tree.identify_region(event.x, event.y) not in ('cell', 'tree'):
+            return
+        index = self.offset + self.tree.index(iid)
+        if event.state & 0x0001 and self.anchor is not None:     # shift
+            self.select_range(self.anchor, index)
+            return "break"
+        if not event.state & 0x0004:    # control
+            # set here too, the treeview sends no <<TreeviewSelect>> when its part of the selection stays the same
+            self.selected = {int(iid)}
+        self.anchor = index
+
+    def select_range(self, first, last):
+        # rows first to last by index, the ids are read on the worker
+        first, last = min(first, last), max(first, last)
+        self.executor.submit(self.collect_ids, self.fetch, first, last + 1,
+                             callback=lambda ids, source=self.source: self.add_selected(source, ids))
+
+    def select_all(self):
+        ''' select every row of the current source, e.g. everything matching
+            the search or the filters, not just the ones loaded
+        '''
+        self.executor.submit(self.collect_ids, self.fetch, 0, None,
+                             callback=lambda ids, source=self.source: self.add_selected(source, ids))
+
+    def collect_ids(self, storage, fetch, start, stop):
+        # runs on the worker thread: the ids of rows start up to stop (None for the end), a big page at a time
+        ids, after, offset = [], None, start
+        while stop is None or offset < stop:
+            limit = self.SELECT_PAGE if stop is None else min(self.SELECT_PAGE, stop - offset)
+            rows = fetch(storage, offset, limit, after)
+            ids += [values[0] for values in rows]
+            if len(rows) < limit:
+                break
+            offset += len(rows)
+            after = rows[-1]
+        return ids
+
+    def add_selected(self, source, ids):
+        if source != self.source:
+            return  # the rows were swapped for others while the ids were read
+        self.selected.update(ids)
+        self.show_selection()
+
+    def evict(self):
+        ''' forget pages that are far away from the visible window
+        '''
+        first = self.offset // self.page_size - self.keep_pages
+        last = (self.offset + self.height) // self.page_size + self.keep_pages
+        for page in list(self.pages):
+            if page < first or page > last:
+                del self.pages[page]
+
+    def update_scrollbar(self):
+        if self.total == 0:
+            self.scrollbary.set(0, 1)
+        else:
+            self.scrollbary.set(self.offset / self.total,
+                                min(self.offset + self.height, self.total) / self.total)
+
+    def scroll_to(self, offset, force=False):
+        offset = max(0, min(offset, self.total - self.height))
+        if offset == self.offset and not force:
+            return
+        self.offset = offset
+        self.update_scrollbar()
+        self.request_window()
+
+    def scroll(self, rows):
+        self.scroll_to(self.offset + rows)
+        return "break"
+
+    def yview(self, *args):
+        ''' scrollbar command, takes the same arguments as Treeview.yview
+        '''
+        if args[0] == 'moveto':
+            self.scroll_to(int(float(args[1]) * self.total))
+        elif args[0] == 'scroll':
+            rows = int(args[1])
+            if args[2] == 'pages':
+                rows *= self.height
+            self.scroll(rows)
+
+    def on_wheel(self, event):
+        # windows and mac report the wheel in multiples of 120
+        return self.scroll(-3 if event.delta > 0 else 3)